@@ -0,0 +1,46 @@
+"""Render thumbnail/card/detail variants for products uploaded before the image
+pipeline, or whose render failed at upload time (stored with no variants).
+
+Usage: python backfill_image_variants.py [--all]
+"""
+import asyncio
+import sys
+
+from server import IMAGE_WORKERS, client, db, get_image_pool, process_product_images
+
+async def backfill(rerender: bool):
+    missing = [{"image_variants": {"$exists": False}}, {"image_variants": {}}, {"image_variants": None}]
+    query = {} if rerender else {"$or": missing}
+    total = await db.products.count_documents(query)
+    print(f"Rendering variants for {total} products")
+
+    # Keep the process pool busy without queueing the whole catalog at once
+    slots = asyncio.Semaphore(IMAGE_WORKERS * 2)
+    done = 0
+
+    async def process(product):
+        nonlocal done
+        async with slots:
+            image_filename = product["image_url"].rsplit("/", 1)[-1]
+            await process_product_images(product["id"], image_filename)
+        done += 1
+        if done % 100 == 0 or done == total:
+            print(f"  {done}/{total}")
+
+    tasks = set()
+    async for product in db.products.find(query, {"_id": 0, "id": 1, "image_url": 1}):
+        tasks.add(asyncio.create_task(process(product)))
+        if len(tasks) >= IMAGE_WORKERS * 4:
+            _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    if tasks:
+        await asyncio.wait(tasks)
+
+def main():
+    try:
+        asyncio.run(backfill(rerender="--all" in sys.argv[1:]))
+    finally:
+        get_image_pool().shutdown()
+        client.close()
+
+if __name__ == "__main__":
+    main()
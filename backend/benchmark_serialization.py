@@ -0,0 +1,76 @@
+"""Compare per-1k-products serialization cost of the old and new GET /api/products paths.
+
+The old path is what FastAPI does for response_model=...: validate every
+document into the model, convert it to JSON-able Python, then json.dumps.
+The new path encodes the projected Mongo documents directly with orjson.
+
+Usage: python benchmark_serialization.py [--products N] [--rounds N]
+"""
+import gzip
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import brotli
+import orjson
+from pydantic import TypeAdapter
+
+from server import ProductPage
+
+def make_page(count: int) -> dict:
+    now = datetime.now(timezone.utc)
+    items = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Produit {i}",
+            "description": "Un produit de qualité, fabriqué en France avec des matériaux durables. " * 3,
+            "price": 9.99 + i,
+            "image_url": f"/uploads/{uuid.uuid4().hex}.jpg",
+            "stock": i % 50,
+            "available": True,
+            "image_variants": {
+                name: {"webp": f"/uploads/variants/x.{name}.webp", "jpeg": f"/uploads/variants/x.{name}.jpg"}
+                for name in ("thumb", "card", "detail")
+            },
+            "created_at": now,
+        }
+        for i in range(count)
+    ]
+    return {"items": items, "next_cursor": None}
+
+def timed(func, rounds: int):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return (time.perf_counter() - started) / rounds * 1000, result
+
+def main():
+    count = int(sys.argv[sys.argv.index("--products") + 1]) if "--products" in sys.argv else 1000
+    rounds = int(sys.argv[sys.argv.index("--rounds") + 1]) if "--rounds" in sys.argv else 20
+    page = make_page(count)
+    adapter = TypeAdapter(ProductPage)
+
+    def pydantic_path():
+        model = adapter.validate_python(page)
+        return json.dumps(adapter.dump_python(model, mode="json"), ensure_ascii=False).encode()
+
+    def orjson_path():
+        return orjson.dumps(page)
+
+    pydantic_ms, pydantic_body = timed(pydantic_path, rounds)
+    orjson_ms, orjson_body = timed(orjson_path, rounds)
+    gzip_ms, gzip_body = timed(lambda: gzip.compress(orjson_body, compresslevel=6), rounds)
+    brotli_ms, brotli_body = timed(lambda: brotli.compress(orjson_body, quality=5), rounds)
+
+    per_1k = 1000 / count
+    print(f"{count} products, {rounds} rounds (times per 1k products)")
+    print(f"  validate + json.dumps: {pydantic_ms * per_1k:8.2f} ms  {len(pydantic_body):>9} bytes")
+    print(f"  orjson, no validation: {orjson_ms * per_1k:8.2f} ms  {len(orjson_body):>9} bytes"
+          f"  ({pydantic_ms / orjson_ms:.1f}x faster)")
+    print(f"  + gzip level 6:        {gzip_ms * per_1k:8.2f} ms  {len(gzip_body):>9} bytes")
+    print(f"  + brotli quality 5:    {brotli_ms * per_1k:8.2f} ms  {len(brotli_body):>9} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Convert ISO-string created_at values written by older releases to BSON datetimes.
+
+Walks users, products and orders in _id order, in batches, and records the
+last converted _id in db.meta so an interrupted run resumes where it stopped.
+
+Usage: python migrate_datetimes.py [--batch-size N]
+"""
+import asyncio
+import sys
+
+from pymongo import UpdateOne
+
+from server import client, db, parse_created_at
+
+COLLECTIONS = ["users", "products", "orders"]
+DEFAULT_BATCH_SIZE = 1000
+
+async def migrate_collection(name: str, batch_size: int):
+    checkpoint_id = f"migrate_datetimes:{name}"
+    checkpoint = await db.meta.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        print(f"{name}: already migrated")
+        return
+
+    last_id = checkpoint.get("last_id")
+    converted = checkpoint.get("converted", 0)
+    while True:
+        query = {"created_at": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db[name].find(query, {"_id": 1, "created_at": 1}) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(batch_size)
+        if not batch:
+            break
+
+        # Matching on the old value leaves documents rewritten meanwhile alone
+        await db[name].bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"], "created_at": doc["created_at"]},
+                {"$set": {"created_at": parse_created_at(doc["created_at"])}},
+            )
+            for doc in batch
+        ], ordered=False)
+
+        last_id = batch[-1]["_id"]
+        converted += len(batch)
+        await db.meta.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": converted}},
+            upsert=True,
+        )
+        print(f"{name}: {converted} converted")
+
+    await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    print(f"{name}: done ({converted} converted)")
+
+async def migrate(batch_size: int):
+    for name in COLLECTIONS:
+        await migrate_collection(name, batch_size)
+
+def main():
+    batch_size = DEFAULT_BATCH_SIZE
+    if "--batch-size" in sys.argv:
+        batch_size = int(sys.argv[sys.argv.index("--batch-size") + 1])
+    try:
+        asyncio.run(migrate(batch_size))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,190 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Header, Request, Response, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+import anyio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, DeleteOne, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import Dict, List, Optional, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
-import shutil
+import orjson
+import brotli
+import gzip
+import base64
+import json
+import asyncio
+import hashlib
+import ipaddress
+import time
+import re
+import bisect
+import heapq
+import math
+import random
+import unicodedata
+import smtplib
+import csv
+import codecs
+import io
+import tempfile
+import zipfile
+import zlib
+from itertools import chain, islice
+import threading
+from contextvars import ContextVar
+from email.message import EmailMessage
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics, exposed in Prometheus text format at /metrics. Each worker
+# process keeps its own registry; Prometheus sums them per instance.
+# Requests slower than this are logged with their DB time breakdown (0 disables)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1'))
+EVENT_LOOP_LAG_INTERVAL = 0.5
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., sum, count]
+        self._series = {}
+        # DB commands are observed from Motor's executor threads
+        self._lock = threading.Lock()
+    
+    def observe(self, values: tuple, amount: float):
+        index = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += amount
+            series[-1] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(values, list(series)) for values, series in self._series.items()]
+        for values, series in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = format_labels(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels + ("le",), values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, values: tuple, amount: float = 1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for values, value in snapshot:
+            lines.append(f"{self.name}{format_labels(self.labels, values)} {value}")
+        return lines
+
+def render_gauge(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route"), LATENCY_BUCKETS
+)
+http_response_size = Histogram(
+    "http_response_size_bytes", "Response body size by route", ("method", "route"), SIZE_BUCKETS
+)
+http_responses = Counter("http_responses_total", "Responses by route and status", ("method", "route", "status"))
+db_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("collection", "command"), LATENCY_BUCKETS
+)
+db_command_failures = Counter("mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"))
+requests_shed = Counter("requests_shed_total", "Requests refused by rate and concurrency limits", ("route", "reason"))
+runtime_gauges = {"http_requests_in_flight": 0, "event_loop_lag_seconds": 0.0}
+
+# (collection, command, seconds) for each DB command run on behalf of the
+# current request; Motor copies the context into its executor threads
+request_db_timings: ContextVar[Optional[list]] = ContextVar("request_db_timings", default=None)
+
+class DBCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = event.database_name
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection, event.command_name, request_db_timings.get()
+        )
+    
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, command, timings = pending
+        seconds = event.duration_micros / 1e6
+        db_command_duration.observe((collection, command), seconds)
+        if failed:
+            db_command_failures.inc((collection, command))
+        if timings is not None:
+            timings.append((collection, command, seconds))
+    
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+    
+    def failed(self, event):
+        self._finish(event, failed=True)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# created_at is stored as a BSON datetime; read it back as aware UTC
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[DBCommandListener()])
 db = client[os.environ['DB_NAME']]
 
 # Security
@@ -30,10 +193,270 @@ security = HTTPBearer()
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 
+# bcrypt runs in a thread pool so it never blocks the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '64'))
+
+# Token-bucket limits as "<requests>/<seconds>", per client IP and per
+# account, on the expensive routes. Buckets live in each worker's memory,
+# or in MongoDB (RATE_LIMIT_STORE=mongo) so limits hold across workers.
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+RATE_LIMITS = {
+    ("login", "ip"): os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60'),
+    ("login", "account"): os.environ.get('RATE_LIMIT_LOGIN_ACCOUNT', '5/60'),
+    ("checkout", "ip"): os.environ.get('RATE_LIMIT_CHECKOUT_IP', '30/60'),
+    ("checkout", "account"): os.environ.get('RATE_LIMIT_CHECKOUT_ACCOUNT', '10/60'),
+    ("hold", "ip"): os.environ.get('RATE_LIMIT_HOLD_IP', '30/60'),
+}
+# Behind a reverse proxy every request comes from the proxy, so all clients
+# would share its buckets. Requests from TRUSTED_PROXIES (IPs or CIDR ranges,
+# comma-separated) are keyed on the address they forward in CLIENT_IP_HEADER.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.environ.get('TRUSTED_PROXIES', '').split(',') if network.strip()
+]
+CLIENT_IP_HEADER = os.environ.get('CLIENT_IP_HEADER', 'x-forwarded-for')
+RATE_LIMIT_MAX_KEYS = 100_000
+# Requests served at once per route and per worker; more wait in a bounded
+# queue, and are shed with a 503 when it is full or they waited too long
+ROUTE_CONCURRENCY = {
+    "login": (int(os.environ.get('LOGIN_CONCURRENCY', '32')), int(os.environ.get('LOGIN_MAX_QUEUE', '64'))),
+    "checkout": (int(os.environ.get('CHECKOUT_CONCURRENCY', '32')), int(os.environ.get('CHECKOUT_MAX_QUEUE', '128'))),
+}
+ROUTE_QUEUE_TIMEOUT = float(os.environ.get('ROUTE_QUEUE_TIMEOUT', '5'))
+
+# Responses at least this large are gzip/brotli compressed when the client accepts it
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# Product listing pagination
+PRODUCTS_PAGE_SIZE = 50
+PRODUCTS_MAX_PAGE_SIZE = 200
+
+# Sort key and direction for each ProductSort; "id" is always the tie-breaker
+PRODUCT_SORTS = {
+    "newest": ("created_at", -1),
+    "oldest": ("created_at", 1),
+    "price_asc": ("price", 1),
+    "price_desc": ("price", -1),
+}
+
+# Catalog cache; the version counter in db.meta invalidates it across workers
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '512'))
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CATALOG_VERSION_POLL_INTERVAL = float(os.environ.get('CATALOG_VERSION_POLL_INTERVAL', '1'))
+
+# Order listing pagination
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+# Completed and refused orders older than this move to orders_archive
+# (0 disables the archiver; reads always include the archive)
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', '180'))
+ORDER_ARCHIVE_INTERVAL = float(os.environ.get('ORDER_ARCHIVE_INTERVAL', '3600'))
+ORDER_ARCHIVE_BATCH_SIZE = 500
+ARCHIVED_ORDER_STATUSES = ["completed", "refused"]
+# Order export: documents fetched per cursor batch, one gzip flush per batch
+ORDERS_EXPORT_BATCH_SIZE = int(os.environ.get('ORDERS_EXPORT_BATCH_SIZE', '500'))
+ORDERS_EXPORT_COLUMNS = [
+    "order_id", "created_at", "status", "customer_name", "customer_email", "customer_phone",
+    "customer_address", "order_total", "product_id", "product_name", "price", "quantity", "line_total",
+]
+
+# Product search
+SEARCH_PAGE_SIZE = 10
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_FIELD_WEIGHTS = {"name": 3.0, "description": 1.0}
+# Cap on vocabulary terms a single prefix expands to, so one-letter
+# typeahead queries stay cheap
+SEARCH_MAX_PREFIX_EXPANSIONS = 50
+SEARCH_STOPWORDS = frozenset(
+    "a au aux avec ce ces d dans de des du en et l la le les pour par sur un une "
+    "and of the".split()
+)
+
+# Order event feed
+ORDER_EVENTS_HISTORY = int(os.environ.get('ORDER_EVENTS_HISTORY', '1000'))
+# Events buffered per subscriber before a slow client is told to resync
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get('ORDER_EVENTS_QUEUE_SIZE', '100'))
+SSE_KEEPALIVE_SECONDS = 15
+# Without change streams (standalone mongod) every worker polls for orders
+# changed by any worker; the lookback covers writes that commit out of order
+ORDER_EVENTS_POLL_INTERVAL = float(os.environ.get('ORDER_EVENTS_POLL_INTERVAL', '2'))
+ORDER_EVENTS_POLL_LOOKBACK_SECONDS = 10
+# Browsers connect to the feed with a short-lived token limited to it, so
+# session tokens never appear in URLs or access logs
+ORDER_EVENTS_SCOPE = "order_events"
+ORDER_EVENTS_TOKEN_SECONDS = 60
+
+# Customer emails go through the notifications outbox; the worker is
+# disabled until an SMTP server (or Gmail credentials) is configured
+SMTP_HOST = os.environ.get('SMTP_HOST') or ('smtp.gmail.com' if os.environ.get('GMAIL_EMAIL') else None)
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME') or os.environ.get('GMAIL_EMAIL')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD') or os.environ.get('GMAIL_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+MAIL_FROM = os.environ.get('MAIL_FROM') or SMTP_USERNAME or 'no-reply@shopmoderne.local'
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', '20'))
+NOTIFICATION_RATE_PER_SECOND = float(os.environ.get('NOTIFICATION_RATE_PER_SECOND', '5'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '8'))
+NOTIFICATION_POLL_INTERVAL = 2
+NOTIFICATION_RETRY_BASE_SECONDS = 30
+NOTIFICATION_RETRY_MAX_SECONDS = 6 * 3600
+# A claimed message whose worker died is picked up again after this long
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS = 300
+NOTIFICATION_RETENTION_SECONDS = 30 * 24 * 3600
+
+# Idempotency-Key handling for POST /api/orders. Keys are remembered this
+# long; a key whose request died mid-flight can be retried after the lock expires
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = 60
+# How long a duplicate waits for the original request before getting a 409
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.2
+
+# Cart holds reserve stock while a customer checks out; a background
+# sweeper gives back the stock of holds that expire
+CART_HOLD_TTL_SECONDS = int(os.environ.get('CART_HOLD_TTL_SECONDS', '600'))
+CART_HOLD_SWEEP_INTERVAL = float(os.environ.get('CART_HOLD_SWEEP_INTERVAL', '5'))
+CART_HOLD_SWEEP_BATCH = 200
+CART_HOLD_RETENTION_SECONDS = 24 * 3600
+# Holds are anonymous, so each client IP gets a few at a time, of a few units per product
+CART_HOLD_MAX_ACTIVE_PER_IP = int(os.environ.get('CART_HOLD_MAX_ACTIVE_PER_IP', '3'))
+CART_HOLD_MAX_QUANTITY = int(os.environ.get('CART_HOLD_MAX_QUANTITY', '20'))
+# Hot products can spread their stock over this many counter documents
+STOCK_SHARDS_MAX = 64
+
+# Dashboard statistics, kept up to date incrementally and recomputed with
+# the aggregation pipeline every STATS_RECONCILE_INTERVAL to fix any drift
+STATS_RECONCILE_INTERVAL = float(os.environ.get('STATS_RECONCILE_INTERVAL', '900'))
+# Revenue buckets older than this are left alone by reconciliation
+STATS_RECONCILE_WINDOW_DAYS = 7
+STATS_HOURLY_RETENTION_SECONDS = 90 * 24 * 3600
+STATS_MAX_BUCKETS = 366
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', '5'))
+LOW_STOCK_LIMIT = 20
+
+# Resolved users cached by token subject
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+# Build the user from the signed token claims instead of looking it up;
+# role changes then only take effect once the token is reissued
+TRUST_TOKEN_CLAIMS = os.environ.get('TRUST_TOKEN_CLAIMS', 'false').lower() == 'true'
+
+ORDER_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True),
+    # GET /api/orders filter combinations, newest first with "id" as tie-breaker
+    IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexModel([("customer.email", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    # Order event polling when change streams are unavailable
+    IndexModel([("updated_at", ASCENDING)]),
+    # Orders with customer emails not yet relayed to db.notifications
+    IndexModel([("outbox.id", ASCENDING)], partialFilterExpression={"outbox.id": {"$exists": True}}),
+]
+
+# Indexes declared per collection; created idempotently at startup
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # GET /api/products filter/sort combinations
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("available", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("price", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("available", ASCENDING), ("price", ASCENDING), ("id", ASCENDING)]),
+        # Low-stock list of GET /api/stats
+        IndexModel([("stock", ASCENDING), ("id", ASCENDING)]),
+        # Fallback for /api/products/search while the in-memory index is building
+        IndexModel(
+            [("name", TEXT), ("description", TEXT)],
+            weights={"name": 3, "description": 1},
+            default_language="french",
+        ),
+    ],
+    "orders": ORDER_INDEXES,
+    # Same queries run against archived orders
+    "orders_archive": ORDER_INDEXES,
+    "notifications": [
+        # Relaying an order's outbox twice upserts the same message
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        # Sent messages are purged after the retention period
+        IndexModel([("sent_at", ASCENDING)], expireAfterSeconds=NOTIFICATION_RETENTION_SECONDS),
+    ],
+    "cart_holds": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Sweeper: active holds past their expiry, closed holds whose stock
+        # hasn't been given back yet
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
+        IndexModel([("release_pending", ASCENDING)], partialFilterExpression={"release_pending": True}),
+        # Active holds per client
+        IndexModel([("client_ip", ASCENDING), ("status", ASCENDING), ("expires_at", ASCENDING)]),
+        # Closed holds are purged after the retention period
+        IndexModel([("closed_at", ASCENDING)], expireAfterSeconds=CART_HOLD_RETENTION_SECONDS),
+    ],
+    "stock_shards": [
+        IndexModel([("product_id", ASCENDING), ("shard", ASCENDING)], unique=True),
+    ],
+    "revenue_series": [
+        IndexModel([("granularity", ASCENDING), ("start", ASCENDING)]),
+        IndexModel(
+            [("start", ASCENDING)],
+            name="hourly_ttl",
+            expireAfterSeconds=STATS_HOURLY_RETENTION_SECONDS,
+            partialFilterExpression={"granularity": "hour"},
+        ),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+    ],
+}
+
 # Create uploads directory
 UPLOADS_DIR = ROOT_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# Image uploads
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Files younger than this are never collected, so an upload whose product
+# insert is still in flight survives a concurrent collection
+UPLOAD_GC_GRACE_SECONDS = int(os.environ.get('UPLOAD_GC_GRACE_SECONDS', '3600'))
+# Resized renditions written next to the originals, as <stem>.<variant>.<ext>
+IMAGE_VARIANTS_DIR = UPLOADS_DIR / "variants"
+IMAGE_VARIANTS_DIR.mkdir(exist_ok=True)
+IMAGE_VARIANT_SIZES = {"thumb": 160, "card": 480, "detail": 1200}
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+# Serve a variant's WebP sibling to clients that accept it
+UPLOADS_NEGOTIATE_WEBP = os.environ.get('UPLOADS_NEGOTIATE_WEBP', 'true').lower() == 'true'
+# Content-hash names (and their variants) and legacy "<uuid>_<name>" uploads
+# never change content, so browsers and CDNs may cache them forever
+IMMUTABLE_UPLOAD_NAME = re.compile(
+    r"^([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_)"
+)
+CONTENT_ADDRESSED_UPLOAD_NAME = re.compile(r"^[0-9a-f]{64}\.")
+# Bulk product import reads image files from directories or .zip archives
+# under this root; CSV/NDJSON rows are upserted in batches of this size
+PRODUCT_IMPORT_ROOT = Path(os.environ.get('PRODUCT_IMPORT_ROOT', str(ROOT_DIR / "imports")))
+PRODUCT_IMPORT_BATCH_SIZE = 500
+PRODUCT_IMPORT_IMAGE_CONCURRENCY = 8
+PRODUCT_EXPORT_BATCH_SIZE = 1000
+PRODUCT_EXPORT_COLUMNS = ["id", "name", "description", "price", "stock", "available", "image_url"]
+# Stable ids for rows identified only by a SKU
+SKU_NAMESPACE = uuid.UUID("5b0e8a6e-3f0c-4d8e-9a57-2c51b4c0f1d3")
+
+# Leading bytes -> extension for the image formats we accept
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -43,12 +466,22 @@ class UserRole(str, Enum):
     MERCHANT = "merchant"
     ADMIN = "admin"
 
+class ProductSort(str, Enum):
+    NEWEST = "newest"
+    OLDEST = "oldest"
+    PRICE_ASC = "price_asc"
+    PRICE_DESC = "price_desc"
+
 class OrderStatus(str, Enum):
     PENDING = "pending"
     ACCEPTED = "accepted"
     REFUSED = "refused"
     COMPLETED = "completed"
 
+class OrderView(str, Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -75,14 +508,51 @@ class Product(BaseModel):
     image_url: str
     stock: int
     available: bool = True
+    # variant name -> format -> URL, filled in once the image pipeline has run
+    image_variants: Dict[str, Dict[str, str]] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: Optional[str] = None
+
+# Documents we wrote ourselves are encoded without re-validation, so list
+# queries project exactly the fields of the response model
+PRODUCT_FIELDS = {"_id": 0, **{field: 1 for field in Product.model_fields}}
+
+def model_defaults(model) -> dict:
+    # Optional fields that documents written before they existed may lack;
+    # ids and timestamps are always stored
+    return {
+        name: field for name, field in model.model_fields.items()
+        if not field.is_required() and name not in ("id", "created_at")
+    }
+
+def fill_defaults(documents: List[dict], defaults: dict) -> List[dict]:
+    # What validation would have filled in, for the unvalidated fast path
+    for document in documents:
+        for name, field in defaults.items():
+            if name not in document:
+                document[name] = field.get_default(call_default_factory=True)
+    return documents
+
+PRODUCT_DEFAULTS = model_defaults(Product)
+
 class ProductCreate(BaseModel):
     name: str
     description: str
     price: float
     stock: int
 
+class ProductImportRow(ProductCreate):
+    model_config = ConfigDict(extra="ignore")
+    id: Optional[str] = None
+    sku: Optional[str] = None
+    available: Optional[bool] = None
+    # Path inside the import's image source, or an already uploaded /uploads/ URL
+    image: Optional[str] = None
+    image_url: Optional[str] = None
+
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -94,7 +564,36 @@ class OrderItem(BaseModel):
     product_id: str
     product_name: str
     price: float
+    quantity: int = Field(gt=0)
+
+class CartLine(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+
+class Cart(BaseModel):
+    items: List[CartLine] = Field(min_length=1)
+
+class CartLineStatus(BaseModel):
+    product_id: str
+    name: Optional[str] = None
+    price: Optional[float] = None
     quantity: int
+    found: bool
+    available: bool
+    stock: int
+    # Units requested beyond the current stock
+    shortfall: int
+    line_total: float
+
+class CartValidation(BaseModel):
+    items: List[CartLineStatus]
+    total: float
+    valid: bool
+
+class CartHold(BaseModel):
+    id: str
+    items: List[CartLine]
+    expires_at: datetime
 
 class CustomerInfo(BaseModel):
     name: str
@@ -111,10 +610,36 @@ class Order(BaseModel):
     status: OrderStatus = OrderStatus.PENDING
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+ORDER_FIELDS = {"_id": 0, **{field: 1 for field in Order.model_fields}}
+ORDER_DEFAULTS = model_defaults(Order)
+
+class OrderSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    customer: CustomerInfo
+    item_count: int
+    total: float
+    status: OrderStatus
+    created_at: datetime
+
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: Optional[str] = None
+
+class OrderSummaryPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: Optional[str] = None
+
 class OrderCreate(BaseModel):
     customer: CustomerInfo
-    items: List[OrderItem]
+    items: List[OrderItem] = Field(min_length=1)
     total: float
+    # Cart hold whose reserved stock the order takes over
+    hold_id: Optional[str] = None
+
+class StatsGranularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
 
 class OrderUpdateStatus(BaseModel):
     status: OrderStatus
@@ -126,31 +651,456 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def parse_created_at(value) -> datetime:
+    # Older releases stored ISO strings; they read back as strings until
+    # migrate_datetimes.py has converted them
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def encode_cursor(sort: str, value, last_id: str) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([sort, value, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, last_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["$date"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return value, last_id
+
+def keyset_filter(field: str, direction: int, value, last_id: str) -> dict:
+    # Strictly after (value, id) in the requested order; "id" breaks ties
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [{field: {op: value}}, {field: value, "id": {op: last_id}}]}
+
+async def ensure_indexes():
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                # e.g. duplicate emails blocking a unique index; keep serving
+                logger.error("Could not create index %s on %s: %s", index.document["name"], collection, e)
+
+async def get_index_report() -> dict:
+    report = {"collections": {}, "warnings": []}
+    for collection, indexes in INDEXES.items():
+        existing = await db[collection].index_information()
+        try:
+            usage = {
+                stats["name"]: stats["accesses"]["ops"]
+                async for stats in db[collection].aggregate([{"$indexStats": {}}])
+            }
+        except OperationFailure:
+            usage = {}
+        declared = [index.document["name"] for index in indexes]
+        
+        report["collections"][collection] = {
+            "indexes": [
+                {
+                    "name": name,
+                    "key": info["key"],
+                    "unique": info.get("unique", False),
+                    "declared": name in declared,
+                    "ops": usage.get(name),
+                }
+                for name, info in existing.items()
+            ],
+            "missing": [name for name in declared if name not in existing],
+        }
+        for name in declared:
+            if name not in existing:
+                report["warnings"].append(f"{collection}: missing index {name}")
+            elif usage.get(name) == 0:
+                report["warnings"].append(f"{collection}: index {name} has not been used since mongod started")
+    return report
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+    
+    async def run(self, func, *args):
+        # Only requests that would have to wait count against the queue
+        if self._slots.locked() and self.queued >= self.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many authentication requests",
+                headers={"Retry-After": "1"},
+            )
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.active -= 1
+            self._slots.release()
+    
+    def stats(self) -> dict:
+        return {"workers": self.workers, "active": self.active, "queued": self.queued, "max_queue": self.max_queue}
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+# Rate limiting
+def parse_rate(spec: str) -> tuple:
+    # "20/60" -> burst of 20, refilled at 20 per 60 seconds
+    count, _, seconds = spec.partition("/")
+    return int(count), int(count) / float(seconds or 1)
+
+def retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+class TokenBuckets:
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        self.burst, self.rate = parse_rate(spec)
+        # key -> (tokens, last refill); least recently used keys are dropped
+        self._buckets = OrderedDict()
+    
+    def take_local(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > RATE_LIMIT_MAX_KEYS:
+            self._buckets.popitem(last=False)
+        return wait
+    
+    async def take_shared(self, key: str) -> float:
+        # Refill and take in one atomic pipeline update on the bucket document
+        now = time.time()
+        refilled = {"$min": [self.burst, {"$add": [
+            {"$ifNull": ["$tokens", self.burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, self.rate]},
+        ]}]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    # An idle bucket is full again after burst / rate seconds
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.burst / self.rate),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / self.rate
+    
+    async def take(self, key: str) -> float:
+        # Seconds until a token is available; 0 when this request may proceed
+        if RATE_LIMIT_STORE == "mongo":
+            return await self.take_shared(key)
+        return self.take_local(key)
+
+rate_limiters = {
+    (route, scope): TokenBuckets(f"{route}:{scope}", spec) for (route, scope), spec in RATE_LIMITS.items()
+}
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_address(request: Request) -> str:
+    address = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(address):
+        return address
+    # The rightmost hop our proxies didn't add; anything left of it can be
+    # forged by the client
+    hops = [hop.strip() for hop in request.headers.get(CLIENT_IP_HEADER, "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        address = hop
+        if not is_trusted_proxy(hop):
+            break
+    return address
+
+async def enforce_rate_limit(route: str, request: Request, account: Optional[str] = None):
+    keys = {"ip": client_address(request)}
+    if account:
+        keys["account"] = account.lower()
+    for scope, key in keys.items():
+        wait = await rate_limiters[(route, scope)].take(key)
+        if wait:
+            requests_shed.inc((route, f"rate_{scope}"))
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": retry_after(wait)},
+            )
+
+class ConcurrencyLimiter:
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(limit)
+    
+    def shed(self, reason: str) -> HTTPException:
+        requests_shed.inc((self.name, reason))
+        return HTTPException(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": retry_after(ROUTE_QUEUE_TIMEOUT)},
+        )
+    
+    async def __aenter__(self):
+        # Only requests that would have to wait count against the queue
+        if self._slots.locked() and self.queued >= self.max_queue:
+            raise self.shed("queue_full")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), ROUTE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise self.shed("queue_timeout")
+        finally:
+            self.queued -= 1
+        self.active += 1
+    
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._slots.release()
+    
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "queued": self.queued, "max_queue": self.max_queue}
+
+route_limiters = {
+    route: ConcurrencyLimiter(route, limit, max_queue) for route, (limit, max_queue) in ROUTE_CONCURRENCY.items()
+}
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+async def save_upload(image: UploadFile) -> str:
+    return await store_image(image.read)
+
+async def store_image(read) -> str:
+    # read(size) is an async callable returning the next chunk
+    chunk = await read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image_extension(chunk)
+    if extension is None:
+        raise HTTPException(status_code=415, detail="Image must be JPEG, PNG, GIF or WebP")
+    
+    # Hash while streaming to a temp file, then store under the content hash
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = UPLOADS_DIR / f".{uuid.uuid4()}.part"
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Image too large")
+                digest.update(chunk)
+                await asyncio.to_thread(buffer.write, chunk)
+                chunk = await read(UPLOAD_CHUNK_SIZE)
+        
+        filename = f"{digest.hexdigest()}{extension}"
+        # Identical images are written once
+        await asyncio.to_thread(os.replace, tmp_path, UPLOADS_DIR / filename)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return filename
+
+def render_image_variants(source: str, variants_dir: str) -> dict:
+    # Runs in a worker process; Pillow is CPU bound and holds the GIL
+    from PIL import Image, ImageOps
+    
+    stem = Path(source).stem
+    variants = {}
+    targets = []
+    for name in IMAGE_VARIANT_SIZES:
+        variants[name] = {}
+        for fmt, extension in (("webp", "webp"), ("jpeg", "jpg")):
+            filename = f"{stem}.{name}.{extension}"
+            variants[name][fmt] = f"/uploads/variants/{filename}"
+            targets.append(Path(variants_dir) / filename)
+    # Content-addressed originals render to the same files every time
+    if all(target.exists() for target in targets):
+        return variants
+    
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ("RGBA", "LA", "P")
+        original = original.convert("RGBA" if has_alpha else "RGB")
+        for name, size in IMAGE_VARIANT_SIZES.items():
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            image.save(Path(variants_dir) / f"{stem}.{name}.webp", "WEBP", quality=80, method=4)
+            if has_alpha:
+                flattened = Image.new("RGB", image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.getchannel("A"))
+                image = flattened
+            image.save(Path(variants_dir) / f"{stem}.{name}.jpg", "JPEG", quality=82, optimize=True, progressive=True)
+    return variants
+
+image_pool = None
+
+def get_image_pool() -> ProcessPoolExecutor:
+    # Created on first use so importing server.py never forks
+    global image_pool
+    if image_pool is None:
+        image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return image_pool
+
+async def process_product_images(product_id: str, image_filename: str):
+    try:
+        variants = await asyncio.get_running_loop().run_in_executor(
+            get_image_pool(), render_image_variants, str(UPLOADS_DIR / image_filename), str(IMAGE_VARIANTS_DIR)
+        )
+    except Exception as e:
+        logger.error("Could not render variants for %s: %s", image_filename, e)
+        return
+    await db.products.update_one({"id": product_id}, {"$set": {"image_variants": variants}})
+    await bump_catalog_version()
+
+async def collect_unreferenced_uploads(dry_run: bool = False) -> dict:
+    referenced = set()
+    async for product in db.products.find({}, {"_id": 0, "image_url": 1}):
+        referenced.add(product.get("image_url", "").rsplit("/", 1)[-1])
+    referenced_stems = {Path(name).stem for name in referenced}
+    
+    def sweep():
+        removed = []
+        cutoff = time.time() - UPLOAD_GC_GRACE_SECONDS
+        for path in UPLOADS_DIR.iterdir():
+            if not path.is_file() or path.name in referenced or path.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            removed.append(path.name)
+        for path in IMAGE_VARIANTS_DIR.iterdir():
+            if path.name.rsplit(".", 2)[0] in referenced_stems or path.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            removed.append(f"variants/{path.name}")
+        return removed
+    
+    removed = await asyncio.to_thread(sweep)
+    return {"removed": removed, "dry_run": dry_run}
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=7)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_user_token(user: User) -> str:
+    return create_access_token({
+        "sub": user.email,
+        "role": user.role,
+        "uid": user.id,
+        "created_at": user.created_at.isoformat(),
+    })
+
+class UserCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+    
+    def get(self, email: str) -> Optional[User]:
+        entry = self._entries.get(email)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[email]
+            return None
+        self._entries.move_to_end(email)
+        return user
+    
+    def set(self, user: User):
+        self._entries[user.email] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.email)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, email: str):
+        self._entries.pop(email, None)
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_user(credentials.credentials)
+
+async def get_stream_user(request: Request, stream_token: Optional[str] = None):
+    # EventSource can't set headers, so browsers pass a stream token from
+    # POST /api/orders/events/token as a query parameter instead
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return await resolve_user(authorization[len("bearer "):])
+    if not stream_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await resolve_user(stream_token, scope=ORDER_EVENTS_SCOPE)
+
+def create_stream_token(user: User) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(seconds=ORDER_EVENTS_TOKEN_SECONDS)
+    return jwt.encode({"sub": user.email, "scope": ORDER_EVENTS_SCOPE, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+async def resolve_user(token: str, scope: Optional[str] = None) -> User:
+    # Session tokens have no scope; scoped tokens only open their own endpoint
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
-        if email is None:
+        if email is None or payload.get("scope") != scope:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_doc = await db.users.find_one({"email": email}, {"_id": 0})
-        if not user_doc:
-            raise HTTPException(status_code=401, detail="User not found")
+        # Tokens issued before the uid claim existed fall through to the lookup
+        if TRUST_TOKEN_CLAIMS and "uid" in payload:
+            return User(id=payload["uid"], email=email, role=payload["role"], created_at=payload["created_at"])
         
-        if isinstance(user_doc['created_at'], str):
-            user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+        user = user_cache.get(email)
+        if user is None:
+            user_doc = await db.users.find_one({"email": email}, {"_id": 0})
+            if not user_doc:
+                raise HTTPException(status_code=401, detail="User not found")
+            
+            user = User(**user_doc)
+            user_cache.set(user)
         
-        return User(**user_doc)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except Exception as e:
+    except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def require_role(required_roles: List[UserRole]):
@@ -160,6 +1110,743 @@ def require_role(required_roles: List[UserRole]):
         return current_user
     return role_checker
 
+# Catalog cache
+class CatalogCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, expires_at, body, etag, encoded = entry
+        if version != self.version or expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return body, etag, encoded
+    
+    def set(self, key, body: bytes, version: int):
+        # `version` is read before querying Mongo, so a write that lands
+        # mid-query leaves the entry already stale and it is never served
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        # Compressed bodies are memoized here so each is only produced once
+        encoded = {}
+        if version == self.version:
+            self._entries[key] = (version, time.monotonic() + self.ttl, body, etag, encoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag, encoded
+    
+    def set_version(self, version: int):
+        if version > self.version:
+            self.version = version
+            self._entries.clear()
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+async def bump_catalog_version():
+    doc = await db.meta.find_one_and_update(
+        {"_id": "catalog_version"},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    catalog_cache.set_version(doc["value"])
+
+async def watch_versions():
+    # Picks up writes made by other workers
+    while True:
+        try:
+            versions = {
+                doc["_id"]: doc["value"]
+                async for doc in db.meta.find({"_id": {"$in": ["catalog_version", "search_version"]}})
+            }
+            catalog_cache.set_version(versions.get("catalog_version", 0))
+            # The first pass also builds the initial search index
+            if not search_index.ready or versions.get("search_version", 0) > search_index.version:
+                await rebuild_search_index()
+        except Exception as e:
+            logger.warning("Could not refresh catalog versions: %s", e)
+        await asyncio.sleep(CATALOG_VERSION_POLL_INTERVAL)
+
+# Product search
+SEARCH_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae"})
+SEARCH_TOKEN = re.compile(r"[a-z0-9]+")
+
+def search_tokens(text: str) -> List[str]:
+    # Accent-insensitive: "Été" and "ete" produce the same token
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold().translate(SEARCH_LIGATURES)
+    return [token for token in SEARCH_TOKEN.findall(text) if token not in SEARCH_STOPWORDS]
+
+class SearchIndex:
+    def __init__(self):
+        self.version = 0
+        self.ready = False
+        self._postings = {}
+        self._documents = {}
+        self._vocabulary = []
+    
+    def add(self, product: dict):
+        self.remove(product["id"])
+        weights = {}
+        for field, field_weight in SEARCH_FIELD_WEIGHTS.items():
+            for token in search_tokens(product.get(field) or ""):
+                weights[token] = weights.get(token, 0.0) + field_weight
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[product["id"]] = weight
+        self._documents[product["id"]] = list(weights)
+    
+    def remove(self, product_id: str):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings[token]
+            del postings[product_id]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+    
+    def _expand(self, token: str):
+        # Every query word is matched as a prefix; exact matches rank higher
+        terms = []
+        position = bisect.bisect_left(self._vocabulary, token)
+        while (
+            position < len(self._vocabulary)
+            and len(terms) < SEARCH_MAX_PREFIX_EXPANSIONS
+            and self._vocabulary[position].startswith(token)
+        ):
+            term = self._vocabulary[position]
+            terms.append((term, 1.0 if term == token else 0.5))
+            position += 1
+        return terms
+    
+    def search(self, query: str, limit: int) -> List[str]:
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        total = len(self._documents)
+        scores = None
+        for token in tokens:
+            token_scores = {}
+            for term, match_weight in self._expand(token):
+                postings = self._postings[term]
+                idf = math.log(1 + total / len(postings))
+                for product_id, weight in postings.items():
+                    score = weight * idf * match_weight
+                    if score > token_scores.get(product_id, 0.0):
+                        token_scores[product_id] = score
+            # Every query word has to match
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+            if not scores:
+                return []
+        return heapq.nlargest(limit, scores, key=scores.get)
+
+search_index = SearchIndex()
+
+async def rebuild_search_index():
+    global search_index
+    # Writes landing during the scan bump the version past this snapshot,
+    # which triggers another rebuild on the next poll
+    doc = await db.meta.find_one({"_id": "search_version"})
+    index = SearchIndex()
+    index.version = doc["value"] if doc else 0
+    async for product in db.products.find({}, {"_id": 0, "id": 1, "name": 1, "description": 1}):
+        index.add(product)
+    index.ready = True
+    search_index = index
+
+async def bump_search_version():
+    doc = await db.meta.find_one_and_update(
+        {"_id": "search_version"},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    # Skipping past another worker's write would hide it from this index
+    if doc["value"] == search_index.version + 1:
+        search_index.version = doc["value"]
+
+# Order event feed
+RESYNC_EVENT = (0, None, "resync", b"{}")
+
+class OrderEventBroker:
+    def __init__(self, history: int, queue_size: int):
+        # Event ids are "<epoch>-<sequence>"; ids from another worker or an
+        # earlier process can't be replayed and get a resync instead
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.queue_size = queue_size
+        # Where every worker's order changes come from: "change_stream",
+        # "poll", or None while each worker publishes only its own changes
+        self.source = None
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+    
+    def publish(self, event_type: str, data: dict):
+        self.sequence += 1
+        event = (self.sequence, f"{self.epoch}-{self.sequence}", event_type, orjson.dumps(data))
+        self._history.append(event)
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Never block on a slow client: drop its backlog and have it refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+    
+    def subscribe(self, last_event_id: Optional[str]) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if last_event_id:
+            missed = self._missed_since(last_event_id)
+            if missed is None or len(missed) >= self.queue_size:
+                queue.put_nowait(RESYNC_EVENT)
+            else:
+                for event in missed:
+                    queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+    
+    def _missed_since(self, last_event_id: str):
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._history[0][0] if self._history else self.sequence + 1
+        if sequence < oldest - 1 or sequence > self.sequence:
+            return None
+        return [event for event in self._history if event[0] > sequence]
+
+order_events = OrderEventBroker(ORDER_EVENTS_HISTORY, ORDER_EVENTS_QUEUE_SIZE)
+
+def publish_order_created(order: dict):
+    order_events.publish("order_created", order)
+
+def publish_order_status(order_id: str, status: str):
+    order_events.publish("order_status", {"id": order_id, "status": status})
+
+def order_event_document(document: dict) -> dict:
+    # The public order fields, without bookkeeping such as the outbox
+    return {field: document[field] for field in Order.model_fields if field in document}
+
+async def poll_order_changes():
+    # Orders carry updated_at, equal to created_at until their status changes
+    order_events.source = "poll"
+    projection = {**ORDER_FIELDS, "updated_at": 1}
+    last_poll = datetime.now(timezone.utc)
+    seen = set()
+    while True:
+        await asyncio.sleep(ORDER_EVENTS_POLL_INTERVAL)
+        started = datetime.now(timezone.utc)
+        lower = last_poll - timedelta(seconds=ORDER_EVENTS_POLL_LOOKBACK_SECONDS)
+        try:
+            # Status changes can still reach archived orders
+            changed = []
+            for collection in (db.orders, db.orders_archive):
+                changed += await collection.find({"updated_at": {"$gte": lower}}, projection).to_list(None)
+        except Exception as e:
+            logger.warning("Order event polling failed: %s", e)
+            continue
+        changed.sort(key=lambda order: order["updated_at"])
+        for order in changed:
+            key = (order["id"], order["updated_at"])
+            if key in seen:
+                continue
+            seen.add(key)
+            updated_at = order.pop("updated_at")
+            if updated_at == order["created_at"]:
+                publish_order_created(order)
+            else:
+                publish_order_status(order["id"], order["status"])
+        seen = {key for key in seen if key[1] >= lower}
+        last_poll = started
+
+async def watch_order_changes():
+    # With a replica set every worker sees every order change through a
+    # change stream; otherwise every worker polls for them
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+    resume_token = None
+    while True:
+        try:
+            async with db.orders.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                order_events.source = "change_stream"
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    document = change.get("fullDocument")
+                    if document is None:
+                        continue
+                    if change["operationType"] == "insert":
+                        publish_order_created(order_event_document(document))
+                    elif "status" in change["updateDescription"]["updatedFields"]:
+                        publish_order_status(document["id"], document["status"])
+        except OperationFailure as e:
+            order_events.source = None
+            if e.code == 40573:
+                logger.info("Change streams unavailable, polling for order events")
+                await poll_order_changes()
+                return
+            logger.warning("Order change stream failed: %s", e)
+        except Exception as e:
+            order_events.source = None
+            logger.warning("Order change stream failed: %s", e)
+        await asyncio.sleep(5)
+
+def format_sse(event) -> bytes:
+    _, event_id, event_type, data = event
+    lines = [] if event_id is None else [f"id: {event_id}".encode()]
+    lines += [f"event: {event_type}".encode(), b"data: " + data]
+    return b"\n".join(lines) + b"\n\n"
+
+# Notifications
+ORDER_STATUS_EMAILS = {
+    OrderStatus.ACCEPTED: ("Votre commande a été acceptée", "Bonne nouvelle ! Votre commande a été acceptée et sera bientôt livrée."),
+    OrderStatus.REFUSED: ("Votre commande a été refusée", "Nous sommes désolés, votre commande n'a pas pu être acceptée."),
+    OrderStatus.COMPLETED: ("Votre commande est livrée", "Votre commande a été livrée. Merci pour votre confiance !"),
+}
+
+def render_order_email(order: dict, intro: str) -> str:
+    lines = [f"Bonjour {order['customer']['name']},", "", intro, "", f"Commande n° {order['id']}"]
+    for item in order["items"]:
+        lines.append(f"  - {item['product_name']} x{item['quantity']} : {item['price'] * item['quantity']:.2f}€")
+    lines += [f"Total : {order['total']:.2f}€", "", "L'équipe ShopModerne"]
+    return "\n".join(lines)
+
+# Emails are recorded in the order's "outbox" array by the same write that
+# creates or updates the order, so neither can happen without the other;
+# the worker then relays them to db.notifications and sends them from there
+def outbox_entry(subject: str, intro: str) -> dict:
+    return {"id": str(uuid.uuid4()), "subject": subject, "intro": intro, "created_at": datetime.now(timezone.utc)}
+
+async def relay_order_outbox(collection) -> int:
+    orders = await collection.find(
+        {"outbox.id": {"$exists": True}}, {"_id": 0, "id": 1, "customer": 1, "items": 1, "total": 1, "outbox": 1}
+    ).limit(NOTIFICATION_BATCH_SIZE).to_list(NOTIFICATION_BATCH_SIZE)
+    if not orders:
+        return 0
+    messages = []
+    relayed = []
+    for order in orders:
+        for entry in order["outbox"]:
+            messages.append(UpdateOne({"id": entry["id"]}, {"$setOnInsert": {
+                "id": entry["id"],
+                "order_id": order["id"],
+                "to": order["customer"]["email"],
+                "subject": entry["subject"],
+                "body": render_order_email(order, entry["intro"]),
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": entry["created_at"],
+                "created_at": entry["created_at"],
+            }}, upsert=True))
+        relayed.append(UpdateOne(
+            {"id": order["id"]}, {"$pull": {"outbox": {"id": {"$in": [entry["id"] for entry in order["outbox"]]}}}}
+        ))
+    # Queued before being pulled off the order; a crash in between only
+    # means the same messages are upserted again
+    await db.notifications.bulk_write(messages, ordered=False)
+    await collection.bulk_write(relayed, ordered=False)
+    return len(orders)
+
+async def relay_order_notifications() -> int:
+    # Status changes can still reach archived orders
+    live, archived = await asyncio.gather(relay_order_outbox(db.orders), relay_order_outbox(db.orders_archive))
+    return max(live, archived)
+
+async def claim_notifications() -> list:
+    now = datetime.now(timezone.utc)
+    claim_expired = now - timedelta(seconds=NOTIFICATION_CLAIM_TIMEOUT_SECONDS)
+    claimed = []
+    while len(claimed) < NOTIFICATION_BATCH_SIZE:
+        # Claiming one at a time keeps concurrent workers from sending twice
+        doc = await db.notifications.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "claimed_at": {"$lt": claim_expired}},
+            ]},
+            {"$set": {"status": "sending", "claimed_at": now}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            break
+        claimed.append(doc)
+    return claimed
+
+def send_emails(messages: list) -> list:
+    # Blocking smtplib; runs in a thread with one connection per batch
+    errors = [None] * len(messages)
+    interval = 1 / NOTIFICATION_RATE_PER_SECOND
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USERNAME and SMTP_PASSWORD:
+            smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        for position, message in enumerate(messages):
+            started = time.monotonic()
+            email = EmailMessage()
+            email["From"] = MAIL_FROM
+            email["To"] = message["to"]
+            email["Subject"] = message["subject"]
+            email.set_content(message["body"])
+            try:
+                smtp.send_message(email)
+            except smtplib.SMTPException as e:
+                errors[position] = str(e)
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return errors
+
+async def process_notifications() -> int:
+    messages = await claim_notifications()
+    if not messages:
+        return 0
+    try:
+        errors = await asyncio.to_thread(send_emails, messages)
+    except (OSError, smtplib.SMTPException) as e:
+        # Connection-level failure: the whole batch is retried
+        errors = [str(e)] * len(messages)
+    
+    now = datetime.now(timezone.utc)
+    updates = []
+    for message, error in zip(messages, errors):
+        if error is None:
+            updates.append(UpdateOne({"_id": message["_id"]}, {"$set": {"status": "sent", "sent_at": now}}))
+            continue
+        attempts = message["attempts"] + 1
+        if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+            change = {"status": "failed", "attempts": attempts, "last_error": error}
+        else:
+            delay = min(NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempts - 1), NOTIFICATION_RETRY_MAX_SECONDS)
+            change = {
+                "status": "pending",
+                "attempts": attempts,
+                "last_error": error,
+                "next_attempt_at": now + timedelta(seconds=delay),
+            }
+        updates.append(UpdateOne({"_id": message["_id"]}, {"$set": change}))
+    await db.notifications.bulk_write(updates, ordered=False)
+    return len(messages)
+
+async def run_notification_worker():
+    if not SMTP_HOST:
+        logger.info("SMTP is not configured, customer emails stay queued in the outbox")
+    while True:
+        try:
+            relayed = await relay_order_notifications()
+            processed = await process_notifications() if SMTP_HOST else 0
+        except Exception as e:
+            logger.warning("Notification worker failed: %s", e)
+            relayed = processed = 0
+        if max(relayed, processed) < NOTIFICATION_BATCH_SIZE:
+            await asyncio.sleep(NOTIFICATION_POLL_INTERVAL)
+
+# Dashboard statistics
+# db.stats "totals" holds the counters; db.revenue_series one document per
+# hour and per day. Amounts are integer cents so $inc never drifts.
+def to_cents(amount: float) -> int:
+    return round(amount * 100)
+
+def stats_bucket(granularity: str, moment: datetime) -> tuple:
+    moment = parse_created_at(moment)
+    if granularity == StatsGranularity.HOUR.value:
+        start = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return f"hour:{start:%Y-%m-%dT%H}", start
+    start = moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return f"day:{start:%Y-%m-%d}", start
+
+def counts_as_revenue(status: str) -> bool:
+    return status != OrderStatus.REFUSED.value
+
+async def record_stats(totals: dict, created_at: Optional[datetime] = None, orders: int = 0, revenue_cents: int = 0):
+    # One atomic $inc on the totals, plus the revenue buckets of created_at
+    updates = [db.stats.update_one({"_id": "totals"}, {"$inc": totals}, upsert=True)]
+    if created_at is not None and (orders or revenue_cents):
+        operations = []
+        for granularity in (StatsGranularity.HOUR.value, StatsGranularity.DAY.value):
+            key, start = stats_bucket(granularity, created_at)
+            operations.append(UpdateOne(
+                {"_id": key},
+                {"$inc": {"orders": orders, "revenue_cents": revenue_cents},
+                 "$setOnInsert": {"granularity": granularity, "start": start}},
+                upsert=True,
+            ))
+        updates.append(db.revenue_series.bulk_write(operations, ordered=False))
+    await asyncio.gather(*updates)
+
+async def record_order_created(order_doc: dict):
+    status = OrderStatus(order_doc["status"]).value
+    cents = to_cents(order_doc["total"]) if counts_as_revenue(status) else 0
+    await record_stats(
+        {"orders": 1, f"orders_by_status.{status}": 1, "revenue_cents": cents},
+        order_doc["created_at"], orders=1, revenue_cents=cents,
+    )
+
+async def record_order_status_change(order: dict, new_status: str):
+    old_status = OrderStatus(order["status"]).value
+    if old_status == new_status:
+        return
+    cents = 0
+    if counts_as_revenue(old_status) != counts_as_revenue(new_status):
+        cents = to_cents(order["total"]) * (1 if counts_as_revenue(new_status) else -1)
+    await record_stats(
+        {f"orders_by_status.{old_status}": -1, f"orders_by_status.{new_status}": 1, "revenue_cents": cents},
+        order["created_at"], revenue_cents=cents,
+    )
+
+async def record_product_stats(products: int = 0, available: int = 0):
+    if products or available:
+        await record_stats({"products": products, "products_available": available})
+
+async def aggregate_orders(pipeline: list) -> list:
+    # Runs a $group pipeline whose accumulators are all $sum over live and
+    # archived orders, and adds up the groups the two collections share
+    results = await asyncio.gather(*(
+        collection.aggregate(pipeline).to_list(None) for collection in (db.orders, db.orders_archive)
+    ))
+    merged = {}
+    for row in chain.from_iterable(results):
+        group = merged.get(row["_id"])
+        if group is None:
+            merged[row["_id"]] = row
+            continue
+        for field, value in row.items():
+            if field != "_id":
+                group[field] += value
+    return list(merged.values())
+
+async def reconcile_stats():
+    # Archived orders still count; an order caught mid-move may count twice
+    # until the next run
+    order_totals = await aggregate_orders([
+        {"$group": {"_id": "$status", "orders": {"$sum": 1}, "total": {"$sum": "$total"}}},
+    ])
+    product_totals = await db.products.aggregate([
+        {"$group": {"_id": None, "products": {"$sum": 1}, "available": {"$sum": {"$cond": ["$available", 1, 0]}}}},
+    ]).to_list(None)
+    product_totals = product_totals[0] if product_totals else {"products": 0, "available": 0}
+    
+    now = datetime.now(timezone.utc)
+    await db.stats.update_one({"_id": "totals"}, {"$set": {
+        "orders": sum(row["orders"] for row in order_totals),
+        "orders_by_status": {row["_id"]: row["orders"] for row in order_totals},
+        "revenue_cents": sum(to_cents(row["total"]) for row in order_totals if counts_as_revenue(row["_id"])),
+        "products": product_totals["products"],
+        "products_available": product_totals["available"],
+        "reconciled_at": now,
+    }}, upsert=True)
+    
+    # Rebuild the recent revenue buckets, zeroing the ones with no orders left
+    since = stats_bucket(StatsGranularity.DAY.value, now - timedelta(days=STATS_RECONCILE_WINDOW_DAYS))[1]
+    buckets = {}
+    for granularity, fmt, step in (
+        (StatsGranularity.HOUR.value, "%Y-%m-%dT%H", timedelta(hours=1)),
+        (StatsGranularity.DAY.value, "%Y-%m-%d", timedelta(days=1)),
+    ):
+        start = since
+        while start <= now:
+            key, _ = stats_bucket(granularity, start)
+            buckets[key] = {"granularity": granularity, "start": start, "orders": 0, "revenue_cents": 0}
+            start += step
+        # $dateToString formats in UTC
+        rows = await aggregate_orders([
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": fmt, "date": "$created_at"}},
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": {"$cond": [{"$ne": ["$status", OrderStatus.REFUSED.value]}, "$total", 0]}},
+            }},
+        ])
+        for row in rows:
+            bucket = buckets.get(f"{granularity}:{row['_id']}")
+            if bucket is not None:
+                bucket["orders"] = row["orders"]
+                bucket["revenue_cents"] = to_cents(row["revenue"])
+    await db.revenue_series.bulk_write([
+        UpdateOne({"_id": key}, {"$set": bucket}, upsert=True) for key, bucket in buckets.items()
+    ], ordered=False)
+
+async def run_stats_reconciler():
+    while True:
+        try:
+            await reconcile_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Stats reconciliation failed")
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+
+# Order archive
+# Old completed/refused orders live in orders_archive so the working set and
+# its indexes stay small; order reads query both collections and merge
+def archive_may_match(query: dict) -> bool:
+    status = query.get("status")
+    if status is not None and status not in ARCHIVED_ORDER_STATUSES:
+        return False
+    lower = query.get("created_at", {}).get("$gte")
+    # Nothing newer than the archive age has ever been archived
+    if lower is not None and ORDER_ARCHIVE_AFTER_DAYS:
+        return lower < datetime.now(timezone.utc) - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)
+    return True
+
+def order_sort_key(order: dict) -> tuple:
+    return parse_created_at(order["created_at"]), order["id"]
+
+def merge_order_pages(live: list, archived: list, descending: bool) -> list:
+    # An order being moved can briefly be in both; the live copy wins
+    live_ids = {order["id"] for order in live}
+    merged = live + [order for order in archived if order["id"] not in live_ids]
+    merged.sort(key=order_sort_key, reverse=descending)
+    return merged
+
+async def merge_order_cursors(cursors: list):
+    # Merges cursors sorted oldest first, skipping the duplicate of an order
+    # caught mid-move (both copies have the same sort key, so they're adjacent)
+    iterators = [cursor.__aiter__() for cursor in cursors]
+    heads = []
+    for index, iterator in enumerate(iterators):
+        order = await anext(iterator, None)
+        if order is not None:
+            heapq.heappush(heads, (order_sort_key(order), index, order))
+    last_id = None
+    while heads:
+        _, index, order = heapq.heappop(heads)
+        if order["id"] != last_id:
+            yield order
+        last_id = order["id"]
+        following = await anext(iterators[index], None)
+        if following is not None:
+            heapq.heappush(heads, (order_sort_key(following), index, following))
+
+async def find_order(order_id: str) -> Optional[dict]:
+    order = await db.orders.find_one({"id": order_id}, ORDER_FIELDS)
+    if order is None:
+        order = await db.orders_archive.find_one({"id": order_id}, ORDER_FIELDS)
+    return order
+
+async def archive_orders_batch(cutoff: datetime) -> int:
+    batch = await db.orders.find(
+        {"status": {"$in": ARCHIVED_ORDER_STATUSES}, "created_at": {"$lt": cutoff}}, {"_id": 0}
+    ).sort([("created_at", 1), ("id", 1)]).limit(ORDER_ARCHIVE_BATCH_SIZE).to_list(ORDER_ARCHIVE_BATCH_SIZE)
+    if not batch:
+        return 0
+    
+    # Copy first, then delete only what didn't change meanwhile; a crash in
+    # between leaves duplicates that reads skip and the next pass cleans up
+    await db.orders_archive.bulk_write([
+        ReplaceOne({"id": order["id"]}, order, upsert=True) for order in batch
+    ], ordered=False)
+    await db.orders.bulk_write([
+        DeleteOne({"id": order["id"], "status": order["status"]}) for order in batch
+    ], ordered=False)
+    ids = [order["id"] for order in batch]
+    still_live = await db.orders.distinct("id", {"id": {"$in": ids}})
+    if still_live:
+        await db.orders_archive.delete_many({"id": {"$in": still_live}})
+    return len(batch) - len(still_live)
+
+async def restore_archived_order(order_id: str):
+    # An archived order moved back to a status the archive never holds goes
+    # live again, where status filters and the merchant queue look for it.
+    # Copy first, then delete; reads prefer the live copy in between.
+    order = await db.orders_archive.find_one({"id": order_id}, {"_id": 0})
+    if order is None:
+        return
+    await db.orders.replace_one({"id": order_id}, order, upsert=True)
+    await db.orders_archive.delete_one({"id": order_id})
+
+async def archive_orders() -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)
+    archived = 0
+    while True:
+        moved = await archive_orders_batch(cutoff)
+        archived += moved
+        if moved == 0:
+            return archived
+        # Let the rest of the app breathe between batches
+        await asyncio.sleep(0)
+
+async def run_order_archiver():
+    if not ORDER_ARCHIVE_AFTER_DAYS:
+        return
+    while True:
+        try:
+            archived = await archive_orders()
+            if archived:
+                logger.info("Archived %d orders", archived)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Order archiving failed")
+        await asyncio.sleep(ORDER_ARCHIVE_INTERVAL)
+
+# JSON responses
+def accepted_encodings(request: Request) -> set:
+    return {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("accept-encoding", "").split(",")
+    }
+
+def accepted_encoding(request: Request) -> Optional[str]:
+    accepted = accepted_encodings(request)
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def json_response(
+    request: Request,
+    body: bytes,
+    headers: Optional[dict] = None,
+    etag: Optional[str] = None,
+    encoded: Optional[dict] = None,
+) -> Response:
+    headers = dict(headers or {})
+    encoding = None
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = accepted_encoding(request)
+    
+    if etag is not None:
+        # Each encoding is a distinct representation with its own strong ETag
+        if encoding:
+            etag = f'{etag[:-1]}-{encoding}"'
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+    
+    if encoding:
+        if encoded is None:
+            body = compress(body, encoding)
+        else:
+            if encoding not in encoded:
+                encoded[encoding] = compress(body, encoding)
+            body = encoded[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def catalog_response(request: Request, body: bytes, etag: str, encoded: dict) -> Response:
+    return json_response(request, body, headers={"Cache-Control": "no-cache"}, etag=etag, encoded=encoded)
+
 # Auth endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
@@ -169,26 +1856,28 @@ async def register(user_data: UserCreate):
     
     user = User(email=user_data.email, role=user_data.role)
     user_doc = user.model_dump()
-    user_doc['created_at'] = user_doc['created_at'].isoformat()
-    user_doc['password'] = hash_password(user_data.password)
+    user_doc['password'] = await password_hasher.run(hash_password, user_data.password)
     
     await db.users.insert_one(user_doc)
-    token = create_access_token({"sub": user.email, "role": user.role})
+    # Never keep serving an earlier account that used this email
+    user_cache.invalidate(user.email)
+    token = create_user_token(user)
     
     return {"user": user, "token": token}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
-    user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user_doc or not verify_password(credentials.password, user_doc['password']):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    if isinstance(user_doc['created_at'], str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+async def login(credentials: UserLogin, request: Request):
+    await enforce_rate_limit("login", request, credentials.email)
+    async with route_limiters["login"]:
+        user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+        if not user_doc or not await password_hasher.run(verify_password, credentials.password, user_doc['password']):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_doc.pop('password')
     user = User(**user_doc)
-    token = create_access_token({"sub": user.email, "role": user.role})
+    # A fresh login refreshes the cached user, picking up any role change
+    user_cache.set(user)
+    token = create_user_token(user)
     
     return {"user": user, "token": token}
 
@@ -199,6 +1888,7 @@ async def get_me(current_user: User = Depends(get_current_user)):
 # Product endpoints
 @api_router.post("/products", response_model=Product)
 async def create_product(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     description: str = Form(...),
     price: float = Form(...),
@@ -206,11 +1896,7 @@ async def create_product(
     image: UploadFile = File(...),
     current_user: User = Depends(require_role([UserRole.ADMIN]))
 ):
-    # Save image
-    image_filename = f"{uuid.uuid4()}_{image.filename}"
-    image_path = UPLOADS_DIR / image_filename
-    with open(image_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
+    image_filename = await save_upload(image)
     
     product = Product(
         name=name,
@@ -221,27 +1907,107 @@ async def create_product(
     )
     
     product_doc = product.model_dump()
-    product_doc['created_at'] = product_doc['created_at'].isoformat()
     await db.products.insert_one(product_doc)
+    await record_product_stats(products=1, available=int(product.available))
+    await bump_catalog_version()
+    search_index.add(product_doc)
+    await bump_search_version()
+    # Thumbnails and WebP renditions are generated after the response is sent
+    background_tasks.add_task(process_product_images, product.id, image_filename)
     
     return product
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    for product in products:
-        if isinstance(product['created_at'], str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
+@api_router.get("/products", response_model=ProductPage)
+async def get_products(
+    request: Request,
+    limit: int = Query(PRODUCTS_PAGE_SIZE, ge=1, le=PRODUCTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    available: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: ProductSort = ProductSort.NEWEST,
+):
+    key = ("products", limit, cursor, available, min_price, max_price, sort.value)
+    cached = catalog_cache.get(key)
+    if cached is None:
+        version = catalog_cache.version
+        page = await find_products(limit, cursor, available, min_price, max_price, sort)
+        cached = catalog_cache.set(key, orjson.dumps(page), version)
+    return catalog_response(request, *cached)
+
+async def find_products(
+    limit: int,
+    cursor: Optional[str],
+    available: Optional[bool],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    sort: ProductSort,
+) -> dict:
+    field, direction = PRODUCT_SORTS[sort.value]
+    query = {}
+    if available is not None:
+        query["available"] = available
+    price_range = {}
+    if min_price is not None:
+        price_range["$gte"] = min_price
+    if max_price is not None:
+        price_range["$lte"] = max_price
+    if price_range:
+        query["price"] = price_range
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort.value)
+        query.update(keyset_filter(field, direction, value, last_id))
+    
+    # Fetch one extra document to know whether another page exists
+    products = await db.products.find(query, PRODUCT_FIELDS) \
+        .sort([(field, direction), ("id", direction)]) \
+        .to_list(limit + 1)
+    
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor(sort.value, last[field], last["id"])
+    
+    return {"items": fill_defaults(products, PRODUCT_DEFAULTS), "next_cursor": next_cursor}
+
+@api_router.get("/products/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    available: Optional[bool] = None,
+):
+    query = {}
+    if available is not None:
+        query["available"] = available
+    
+    if search_index.ready:
+        # Over-fetch when filtering so hidden products don't leave the page short
+        product_ids = search_index.search(q, limit if available is None else limit * 4)
+        query["id"] = {"$in": product_ids}
+        products = await db.products.find(query, {"_id": 0}).to_list(None)
+        rank = {product_id: position for position, product_id in enumerate(product_ids)}
+        products.sort(key=lambda product: rank[product["id"]])
+        products = products[:limit]
+    else:
+        query["$text"] = {"$search": q}
+        products = await db.products.find(query, {"_id": 0, "score": {"$meta": "textScore"}}) \
+            .sort([("score", {"$meta": "textScore"})]) \
+            .to_list(limit)
+    
     return products
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if isinstance(product['created_at'], str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return Product(**product)
+async def get_product(product_id: str, request: Request):
+    key = ("product", product_id)
+    cached = catalog_cache.get(key)
+    if cached is None:
+        version = catalog_cache.version
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        cached = catalog_cache.set(key, Product(**product).model_dump_json().encode(), version)
+    return catalog_response(request, *cached)
 
 @api_router.patch("/products/{product_id}", response_model=Product)
 async def update_product(
@@ -257,10 +2023,15 @@ async def update_product(
     
     if update_dict:
         await db.products.update_one({"id": product_id}, {"$set": update_dict})
+        if "stock" in update_dict and product.get("stock_shards"):
+            await adjust_stock_shards(product_id, update_dict["stock"], product["stock_shards"])
+        if "available" in update_dict and update_dict["available"] != product["available"]:
+            await record_product_stats(available=1 if update_dict["available"] else -1)
+        await bump_catalog_version()
         product.update(update_dict)
-    
-    if isinstance(product['created_at'], str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
+        if "name" in update_dict or "description" in update_dict:
+            search_index.add(product)
+            await bump_search_version()
     
     return Product(**product)
 
@@ -269,50 +2040,1001 @@ async def delete_product(
     product_id: str,
     current_user: User = Depends(require_role([UserRole.ADMIN]))
 ):
-    result = await db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    product = await db.products.find_one_and_delete({"id": product_id}, projection={"_id": 0, "available": 1})
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    await db.stock_shards.delete_many({"product_id": product_id})
+    await record_product_stats(products=-1, available=-int(product["available"]))
+    await bump_catalog_version()
+    search_index.remove(product_id)
+    await bump_search_version()
     return {"message": "Product deleted"}
 
-# Order endpoints
-@api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate):
-    # Check stock and update
-    for item in order_data.items:
-        product = await db.products.find_one({"id": item.product_id})
+# Product import/export
+class ImageSource:
+    # A directory or .zip archive under PRODUCT_IMPORT_ROOT
+    def __init__(self, name: str):
+        root = PRODUCT_IMPORT_ROOT.resolve()
+        self.path = (root / name).resolve()
+        if not self.path.is_relative_to(root) or not self.path.exists():
+            raise HTTPException(status_code=400, detail=f"Image source {name} not found under the import root")
+        self.archive = zipfile.ZipFile(self.path) if self.path.is_file() else None
+    
+    def open(self, name: str):
+        if self.archive is not None:
+            return self.archive.open(name.lstrip("/"))
+        path = (self.path / name).resolve()
+        if not path.is_relative_to(self.path):
+            raise FileNotFoundError(name)
+        return open(path, "rb")
+    
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+async def import_image(source: ImageSource, name: str) -> str:
+    handle = await asyncio.to_thread(source.open, name)
+    try:
+        return await store_image(lambda size: asyncio.to_thread(handle.read, size))
+    finally:
+        handle.close()
+
+def read_import_rows(handle, file_format: str):
+    # Yields (row number, dict or parse error); the spooled body is read
+    # line by line so memory stays flat whatever the file size
+    lines = codecs.iterdecode(handle, "utf-8-sig")
+    if file_format == "csv":
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, f"Invalid JSON: {exc}"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+def read_import_chunk(rows, size: int) -> tuple:
+    # Rows read before undecodable bytes or malformed CSV are kept; the
+    # reader can't resume past such an error, so it ends the import
+    chunk = []
+    try:
+        for row in islice(rows, size):
+            chunk.append(row)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        return chunk, exc
+    return chunk, None
+
+def parse_import_row(raw) -> tuple:
+    # Returns (ProductImportRow, None) or (None, errors)
+    if isinstance(raw, str):
+        return None, [{"field": None, "message": raw}]
+    # Empty CSV cells mean "not provided"
+    values = {key: value for key, value in raw.items() if key and value not in ("", None)}
+    try:
+        row = ProductImportRow(**values)
+    except ValidationError as exc:
+        return None, [{"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]} for error in exc.errors()]
+    if not row.id:
+        if not row.sku:
+            return None, [{"field": "id", "message": "Either id or sku is required"}]
+        row.id = str(uuid.uuid5(SKU_NAMESPACE, row.sku))
+    return row, None
+
+async def import_product_batch(batch: list, source: Optional[ImageSource], rendered: list) -> dict:
+    # batch holds (row number, ProductImportRow); later rows win within a batch
+    rows = {row.id: (number, row) for number, row in batch}
+    existing = {
+        product["id"]: product
+        for product in await db.products.find(
+            {"id": {"$in": list(rows)}}, {"_id": 0, "id": 1, "image_url": 1, "available": 1}
+        ).to_list(None)
+    }
+    errors = []
+    slots = asyncio.Semaphore(PRODUCT_IMPORT_IMAGE_CONCURRENCY)
+    
+    async def resolve_image(number: int, row: ProductImportRow) -> Optional[str]:
+        if row.image:
+            if source is None:
+                raise ValueError("Rows reference images but no image source was given")
+            async with slots:
+                return f"/uploads/{await import_image(source, row.image)}"
+        if row.image_url:
+            if not row.image_url.startswith("/uploads/") or not (UPLOADS_DIR / row.image_url.rsplit("/", 1)[-1]).exists():
+                raise ValueError(f"{row.image_url} is not an uploaded image")
+            return row.image_url
+        if row.id not in existing:
+            raise ValueError("New products need an image or image_url")
+        return None
+    
+    results = await asyncio.gather(
+        *(resolve_image(number, row) for number, row in rows.values()), return_exceptions=True
+    )
+    now = datetime.now(timezone.utc)
+    operations = []
+    written = []
+    for (number, row), image_url in zip(rows.values(), results):
+        if isinstance(image_url, HTTPException):
+            errors.append({"row": number, "id": row.id, "errors": [{"field": "image", "message": image_url.detail}]})
+            continue
+        if isinstance(image_url, BaseException):
+            errors.append({"row": number, "id": row.id, "errors": [{"field": "image", "message": str(image_url)}]})
+            continue
+        fields = row.model_dump(include={"name", "description", "price", "stock"})
+        if row.available is not None:
+            fields["available"] = row.available
+        on_insert = {"id": row.id, "created_at": now}
+        old = existing.get(row.id)
+        if image_url is not None and (old is None or old.get("image_url") != image_url):
+            fields["image_url"] = image_url
+            # Stale renditions are replaced once the new variants are rendered
+            fields["image_variants"] = {}
+            rendered.append((row.id, image_url.rsplit("/", 1)[-1]))
+        if row.available is None:
+            on_insert["available"] = True
+        operations.append(UpdateOne({"id": row.id}, {"$set": fields, "$setOnInsert": on_insert}, upsert=True))
+        written.append((number, row))
+    
+    failed_rows = set()
+    if operations:
+        try:
+            await db.products.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details["writeErrors"]:
+                number, row = written[error["index"]]
+                failed_rows.add(number)
+                errors.append({"row": number, "id": row.id, "errors": [{"field": None, "message": error["errmsg"]}]})
+    
+    created = available_delta = 0
+    for number, row in written:
+        if number in failed_rows:
+            continue
+        old = existing.get(row.id)
+        available = row.available if row.available is not None else (old["available"] if old else True)
+        if old is None:
+            created += 1
+            available_delta += int(available)
+        elif available != old["available"]:
+            available_delta += 1 if available else -1
+        search_index.add({"id": row.id, "name": row.name, "description": row.description})
+    await record_product_stats(products=created, available=available_delta)
+    if written:
+        await bump_catalog_version()
+        await bump_search_version()
+    return {"created": created, "updated": len(written) - len(failed_rows) - created, "errors": errors}
+
+async def render_imported_images(images: list):
+    slots = asyncio.Semaphore(IMAGE_WORKERS * 2)
+    
+    async def render(product_id: str, image_filename: str):
+        async with slots:
+            await process_product_images(product_id, image_filename)
+    
+    await asyncio.gather(*(render(product_id, image_filename) for product_id, image_filename in images))
+
+def close_product_import(handle, source: Optional[ImageSource]):
+    # Safe to call twice: the stream closes both when it ends, the response's
+    # background task in case it never ran to the end
+    handle.close()
+    if source is not None:
+        source.close()
+
+async def run_product_import(handle, file_format: str, source: Optional[ImageSource], rendered: list):
+    # NDJSON progress stream: one line per rejected row, one per batch, one at the end
+    totals = {"rows": 0, "created": 0, "updated": 0, "failed": 0}
+    rows = read_import_rows(handle, file_format)
+    aborted = None
+    try:
+        while aborted is None:
+            chunk, aborted = await asyncio.to_thread(read_import_chunk, rows, PRODUCT_IMPORT_BATCH_SIZE)
+            if not chunk and aborted is None:
+                break
+            totals["rows"] += len(chunk)
+            batch = []
+            errors = []
+            for number, raw in chunk:
+                row, row_errors = parse_import_row(raw)
+                if row_errors:
+                    errors.append({"row": number, "id": raw.get("id") if isinstance(raw, dict) else None, "errors": row_errors})
+                else:
+                    batch.append((number, row))
+            if batch:
+                result = await import_product_batch(batch, source, rendered)
+                totals["created"] += result["created"]
+                totals["updated"] += result["updated"]
+                errors += result["errors"]
+            if aborted is not None:
+                reason = "Invalid UTF-8" if isinstance(aborted, UnicodeDecodeError) else "Malformed CSV"
+                errors.append({
+                    "row": totals["rows"] + 1,
+                    "id": None,
+                    "errors": [{"field": None, "message": f"{reason}: {aborted}"}],
+                    "fatal": True,
+                })
+            totals["failed"] += len(errors)
+            for error in sorted(errors, key=lambda error: error["row"]):
+                yield orjson.dumps({"error": error}) + b"\n"
+            yield orjson.dumps({"progress": totals}) + b"\n"
+    finally:
+        close_product_import(handle, source)
+    # "aborted" tells the client the rows after the fatal error were never read
+    yield orjson.dumps({"done": totals, "aborted": aborted is not None}) + b"\n"
+
+async def export_products(file_format: str):
+    # Streams the catalog batch by batch, in id order
+    cursor = db.products.find({}, PRODUCT_FIELDS).sort("id", ASCENDING).batch_size(PRODUCT_EXPORT_BATCH_SIZE)
+    if file_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=PRODUCT_EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        count = 0
+        async for product in cursor:
+            writer.writerow(product)
+            count += 1
+            if count % PRODUCT_EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+        return
+    lines = []
+    async for product in cursor:
+        lines.append(orjson.dumps(product) + b"\n")
+        if len(lines) == PRODUCT_EXPORT_BATCH_SIZE:
+            yield b"".join(lines)
+            lines = []
+    yield b"".join(lines)
+
+async def spool_request_body(request: Request):
+    # The body is copied to a temp file first: the progress stream can't
+    # start while the request body is still being received
+    handle = tempfile.TemporaryFile()
+    try:
+        async for chunk in request.stream():
+            await asyncio.to_thread(handle.write, chunk)
+        await asyncio.to_thread(handle.seek, 0)
+    except BaseException:
+        handle.close()
+        raise
+    return handle
+
+@api_router.post("/admin/products/import")
+async def import_products(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    images: Optional[str] = None,
+    current_user: User = Depends(require_role([UserRole.ADMIN]))
+):
+    # Body is the raw CSV (with a header row) or NDJSON file
+    if file_format is None:
+        file_format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    handle = await spool_request_body(request)
+    try:
+        source = ImageSource(images) if images else None
+    except BaseException:
+        handle.close()
+        raise
+    rendered = []
+    # Runs after the response even when the stream was cut or never started
+    background_tasks.add_task(close_product_import, handle, source)
+    # Thumbnails and WebP renditions are rendered once the import is done
+    background_tasks.add_task(render_imported_images, rendered)
+    return StreamingResponse(
+        run_product_import(handle, file_format, source, rendered),
+        media_type="application/x-ndjson",
+    )
+
+@api_router.get("/admin/products/export")
+async def export_product_catalog(
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(require_role([UserRole.ADMIN]))
+):
+    extension = "csv" if file_format == "csv" else "ndjson"
+    return StreamingResponse(
+        export_products(file_format),
+        media_type="text/csv" if file_format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="products.{extension}"'},
+    )
+
+# Stock reservation
+# Stock lives on the product document or, for hot products, in counter
+# documents in db.stock_shards so concurrent reservations don't all contend
+# on one document. Whatever a reservation decrements is tagged with its tag
+# (the order id, or "hold:<id>" for cart holds) so it can be undone exactly;
+# shards record {"tag", "quantity"} since a line can be split across them.
+def hold_tag(hold_id: str) -> str:
+    return f"hold:{hold_id}"
+
+def line_quantities(items) -> dict:
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+def split_stock(total: int, shards: int) -> List[int]:
+    return [total // shards + (1 if shard < total % shards else 0) for shard in range(shards)]
+
+async def take_from_shards(product_id: str, quantity: int, tag: Optional[str] = None) -> int:
+    # Takes what each shard has, rereading after a lost race. A reservation
+    # (tag given) stops as soon as the shards together can't cover the rest and
+    # records what it took on each shard; a plain decrement takes what it can.
+    taken = 0
+    while taken < quantity:
+        available = await db.stock_shards.find(
+            {"product_id": product_id, "stock": {"$gt": 0}}, {"_id": 0, "shard": 1, "stock": 1}
+        ).to_list(None)
+        if not available or (tag and sum(shard["stock"] for shard in available) < quantity - taken):
+            break
+        for shard in available:
+            take = min(shard["stock"], quantity - taken)
+            update = {"$inc": {"stock": -take}}
+            if tag:
+                update["$push"] = {"pending_orders": {"tag": tag, "quantity": take}}
+            result = await db.stock_shards.update_one(
+                {"product_id": product_id, "shard": shard["shard"], "stock": {"$gte": take}}, update
+            )
+            taken += take * result.modified_count
+            if taken == quantity:
+                break
+    return taken
+
+async def adjust_stock_shards(product_id: str, total: int, shards: int):
+    # Moves the shard total to `total` with increments so that reservations
+    # made since it was read are kept
+    current = await db.stock_shards.find({"product_id": product_id}, {"_id": 0, "stock": 1}).to_list(None)
+    difference = total - sum(shard["stock"] for shard in current)
+    if difference > 0:
+        await db.stock_shards.bulk_write([
+            UpdateOne({"product_id": product_id, "shard": shard}, {"$inc": {"stock": stock}})
+            for shard, stock in enumerate(split_stock(difference, shards)) if stock
+        ])
+    elif difference < 0:
+        await take_from_shards(product_id, -difference)
+
+async def reserve_from_shards(tag: str, product_id: str, quantity: int, shards: int) -> bool:
+    # Start at a random shard so concurrent buyers spread out; a line too big
+    # for any one shard is split across them
+    start = random.randrange(shards)
+    for offset in range(shards):
+        result = await db.stock_shards.update_one(
+            {"product_id": product_id, "shard": (start + offset) % shards, "stock": {"$gte": quantity}},
+            {"$inc": {"stock": -quantity}, "$push": {"pending_orders": {"tag": tag, "quantity": quantity}}},
+        )
+        if result.modified_count:
+            return True
+    return await take_from_shards(product_id, quantity, tag) == quantity
+
+async def resolve_cart(product_ids: List[str]) -> dict:
+    # Every product of a cart in one round trip, keyed by id
+    products = await db.products.find(
+        {"id": {"$in": product_ids}},
+        {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1, "available": 1, "stock_shards": 1},
+    ).to_list(None)
+    return {product["id"]: product for product in products}
+
+def check_cart(quantities: dict, products_by_id: dict) -> dict:
+    items = []
+    total = 0.0
+    for product_id, quantity in quantities.items():
+        product = products_by_id.get(product_id)
+        if product is None:
+            items.append({"product_id": product_id, "quantity": quantity, "found": False, "available": False,
+                          "stock": 0, "shortfall": quantity, "line_total": 0.0})
+            continue
+        line_total = round(product["price"] * quantity, 2) if product["available"] else 0.0
+        total += line_total
+        items.append({
+            "product_id": product_id,
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": quantity,
+            "found": True,
+            "available": product["available"],
+            "stock": product["stock"],
+            "shortfall": max(0, quantity - product["stock"]),
+            "line_total": line_total,
+        })
+    valid = all(item["available"] and not item["shortfall"] for item in items)
+    return {"items": items, "total": round(total, 2), "valid": valid}
+
+async def reserve_stock(tag: str, quantities: dict, names: Optional[dict] = None, products_by_id: Optional[dict] = None):
+    names = names or {}
+    if products_by_id is None:
+        products_by_id = await resolve_cart(list(quantities))
+    sharded = {}
+    for product_id, quantity in quantities.items():
+        product = products_by_id.get(product_id)
+        label = names.get(product_id, product_id)
         if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_name} not found")
-        
+            raise HTTPException(status_code=404, detail=f"Product {label} not found")
         if not product['available']:
-            raise HTTPException(status_code=400, detail=f"Product {item.product_name} is not available")
-        
-        if product['stock'] < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {item.product_name}")
-        
-        # Update stock
-        new_stock = product['stock'] - item.quantity
-        update_data = {"stock": new_stock}
+            raise HTTPException(status_code=400, detail=f"Product {label} is not available")
+        # The stock of a sharded product is a periodically synced total
+        if product.get("stock_shards"):
+            sharded[product_id] = product["stock_shards"]
+        elif product['stock'] < quantity:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {label}")
+    
+    # Conditional decrements can't oversell
+    unsharded = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+    failed = []
+    if unsharded:
+        result = await db.products.bulk_write([
+            UpdateOne(
+                {"id": product_id, "available": True, "stock": {"$gte": quantity}},
+                {"$inc": {"stock": -quantity}, "$push": {"pending_orders": tag}},
+            )
+            for product_id, quantity in unsharded.items()
+        ], ordered=False)
+        if result.modified_count < len(unsharded):
+            reserved = await db.products.distinct("id", {"id": {"$in": list(unsharded)}, "pending_orders": tag})
+            failed += [product_id for product_id in unsharded if product_id not in reserved]
+    if sharded:
+        results = await asyncio.gather(*(
+            reserve_from_shards(tag, product_id, quantities[product_id], shards)
+            for product_id, shards in sharded.items()
+        ))
+        failed += [product_id for product_id, ok in zip(sharded, results) if not ok]
+    
+    if failed:
+        await release_stock(tag, quantities)
+        raise HTTPException(status_code=400, detail=f"Insufficient stock for {names.get(failed[0], failed[0])}")
+
+async def release_reservations(reservations: List[tuple]):
+    # (tag, quantities) pairs; only stock still tagged with its reservation
+    # comes back, so releasing twice is harmless
+    product_ops = []
+    for tag, quantities in reservations:
+        for product_id, quantity in quantities.items():
+            product_ops.append(UpdateOne(
+                {"id": product_id, "pending_orders": tag},
+                {"$inc": {"stock": quantity}, "$pull": {"pending_orders": tag}},
+            ))
+    if not product_ops:
+        return
+    tags = [tag for tag, _ in reservations]
+    shard_ops = []
+    async for shard in db.stock_shards.find(
+        {"pending_orders.tag": {"$in": tags}}, {"_id": 0, "product_id": 1, "shard": 1, "pending_orders": 1}
+    ):
+        held = {}
+        for entry in shard["pending_orders"]:
+            if entry["tag"] in tags:
+                held[entry["tag"]] = held.get(entry["tag"], 0) + entry["quantity"]
+        shard_ops += [
+            UpdateOne(
+                {"product_id": shard["product_id"], "shard": shard["shard"], "pending_orders.tag": tag},
+                {"$inc": {"stock": quantity}, "$pull": {"pending_orders": {"tag": tag}}},
+            )
+            for tag, quantity in held.items()
+        ]
+    writes = [db.products.bulk_write(product_ops, ordered=False)]
+    if shard_ops:
+        writes.append(db.stock_shards.bulk_write(shard_ops, ordered=False))
+    await asyncio.gather(*writes)
+    await bump_catalog_version()
+
+async def release_stock(tag: str, quantities: dict):
+    await release_reservations([(tag, quantities)])
+
+async def settle_stock(tag: str, product_ids: List[str]):
+    _, sold_out, _ = await asyncio.gather(
+        db.products.update_many({"id": {"$in": product_ids}}, {"$pull": {"pending_orders": tag}}),
+        # Auto set to unavailable if stock reaches 0; sharded products are
+        # handled by sync_sharded_stock
+        db.products.update_many(
+            {"id": {"$in": product_ids}, "available": True, "stock": {"$lte": 0}, "stock_shards": {"$not": {"$gt": 0}}},
+            {"$set": {"available": False}},
+        ),
+        db.stock_shards.update_many(
+            {"product_id": {"$in": product_ids}, "pending_orders.tag": tag}, {"$pull": {"pending_orders": {"tag": tag}}}
+        ),
+    )
+    await record_product_stats(available=-sold_out.modified_count)
+    await bump_catalog_version()
+
+async def sync_sharded_stock():
+    # Publish the shard totals on the product documents for listings
+    totals = await db.stock_shards.aggregate([
+        {"$group": {
+            "_id": "$product_id",
+            "stock": {"$sum": "$stock"},
+            "pending": {"$sum": {"$size": {"$ifNull": ["$pending_orders", []]}}},
+        }},
+    ]).to_list(None)
+    operations = []
+    for total in totals:
+        update = {"stock": total["stock"]}
+        # Sold out only once no reservation can still give stock back
+        if total["stock"] <= 0 and total["pending"] == 0:
+            update["available"] = False
+        operations.append(UpdateOne({"id": total["_id"], "stock_shards": {"$gt": 0}}, {"$set": update}))
+    if operations:
+        result = await db.products.bulk_write(operations, ordered=False)
+        if result.modified_count:
+            await bump_catalog_version()
+
+# Cart holds
+async def create_hold(lines: List[CartLine], client_ip: str) -> dict:
+    quantities = line_quantities(lines)
+    if max(quantities.values()) > CART_HOLD_MAX_QUANTITY:
+        raise HTTPException(
+            status_code=422, detail=f"At most {CART_HOLD_MAX_QUANTITY} units of a product can be held"
+        )
+    now = datetime.now(timezone.utc)
+    hold = {
+        "id": str(uuid.uuid4()),
+        "items": [line.model_dump() for line in lines],
+        "status": "active",
+        "client_ip": client_ip,
+        "expires_at": now + timedelta(seconds=CART_HOLD_TTL_SECONDS),
+        "created_at": now,
+    }
+    # Recorded before reserving so the sweeper can release it if we crash midway
+    await db.cart_holds.insert_one(hold)
+    # Counted after inserting, so concurrent requests from one client always
+    # see each other: the last one in sees them all and backs out if over
+    active = await db.cart_holds.count_documents(
+        {"client_ip": client_ip, "status": "active", "expires_at": {"$gt": now}}
+    )
+    if active > CART_HOLD_MAX_ACTIVE_PER_IP:
+        await db.cart_holds.delete_one({"id": hold["id"]})
+        requests_shed.inc(("hold", "active_holds"))
+        raise HTTPException(status_code=429, detail="Too many active cart holds")
+    try:
+        await reserve_stock(hold_tag(hold["id"]), quantities)
+    except HTTPException:
+        # Rejected holds have already given back what they took
+        await db.cart_holds.delete_one({"id": hold["id"]})
+        raise
+    except BaseException:
+        closed = await close_hold(hold["id"], "released")
+        if closed:
+            await finish_hold_release([closed])
+        raise
+    return hold
+
+async def close_hold(hold_id: str, status: str, require_unexpired: bool = False) -> Optional[dict]:
+    # Atomically moves an active hold to its final status; None if it was
+    # already closed (or expired, when require_unexpired). Holds closed
+    # without an order stay release_pending until their stock is back.
+    now = datetime.now(timezone.utc)
+    query = {"id": hold_id, "status": "active"}
+    if require_unexpired:
+        query["expires_at"] = {"$gt": now}
+    update = {"status": status, "closed_at": now}
+    if status != "converted":
+        update["release_pending"] = True
+    return await db.cart_holds.find_one_and_update(query, {"$set": update}, projection={"_id": 0})
+
+async def finish_hold_release(holds: List[dict]):
+    # Releasing is conditional on the stock still being tagged, so a hold
+    # released twice (by a request and by the sweeper) only gives back once
+    await release_reservations([
+        (hold_tag(hold["id"]), line_quantities(CartLine(**item) for item in hold["items"]))
+        for hold in holds
+    ])
+    await db.cart_holds.update_many(
+        {"id": {"$in": [hold["id"] for hold in holds]}}, {"$unset": {"release_pending": ""}}
+    )
+
+async def release_expired_holds() -> int:
+    now = datetime.now(timezone.utc)
+    await db.cart_holds.update_many(
+        {"status": "active", "expires_at": {"$lte": now}},
+        {"$set": {"status": "expired", "closed_at": now, "release_pending": True}},
+    )
+    # Also retries holds closed by a request or an earlier sweep that died
+    # before giving their stock back
+    released = 0
+    while True:
+        batch = await db.cart_holds.find(
+            {"release_pending": True}, {"_id": 0, "id": 1, "items": 1}
+        ).limit(CART_HOLD_SWEEP_BATCH).to_list(CART_HOLD_SWEEP_BATCH)
+        if not batch:
+            return released
+        await finish_hold_release(batch)
+        released += len(batch)
+        if len(batch) < CART_HOLD_SWEEP_BATCH:
+            return released
+
+async def run_hold_sweeper():
+    while True:
+        try:
+            released = await release_expired_holds()
+            if released:
+                logger.info("Released the stock of %d closed cart holds", released)
+            await sync_sharded_stock()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cart hold sweep failed")
+        await asyncio.sleep(CART_HOLD_SWEEP_INTERVAL)
+
+@api_router.post("/cart/validate", response_model=CartValidation)
+async def validate_cart(cart: Cart):
+    quantities = line_quantities(cart.items)
+    return check_cart(quantities, await resolve_cart(list(quantities)))
+
+@api_router.post("/cart/holds", response_model=CartHold)
+async def hold_cart(hold_data: Cart, request: Request):
+    await enforce_rate_limit("hold", request)
+    async with route_limiters["checkout"]:
+        return await create_hold(hold_data.items, client_address(request))
+
+@api_router.delete("/cart/holds/{hold_id}")
+async def release_cart_hold(hold_id: str):
+    hold = await close_hold(hold_id, "released")
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found or already closed")
+    await finish_hold_release([hold])
+    return {"message": "Hold released"}
+
+# Idempotent requests
+# Requests with the same key running in this worker share one execution
+idempotency_inflight: Dict[str, tuple] = {}
+
+def request_fingerprint(payload: dict) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def idempotency_mismatch() -> HTTPException:
+    return HTTPException(status_code=422, detail="Idempotency-Key already used for a different request")
+
+async def claim_idempotency_key(key: str, fingerprint: str) -> Optional[dict]:
+    # Returns the stored record to replay, or None once this request owns the key
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one(
+                {"_id": key, "fingerprint": fingerprint, "state": "started", "locked_at": now, "created_at": now}
+            )
+            return None
+        except DuplicateKeyError:
+            pass
         
-        # Auto set to unavailable if stock reaches 0
-        if new_stock <= 0:
-            update_data["available"] = False
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if record is None:
+            # The first attempt failed and gave the key back
+            continue
+        if record["fingerprint"] != fingerprint:
+            raise idempotency_mismatch()
+        if record["state"] == "completed":
+            return record
         
-        await db.products.update_one({"id": item.product_id}, {"$set": update_data})
+        # The worker holding the key died before finishing; take it over
+        stale = await db.idempotency_keys.update_one(
+            {"_id": key, "state": "started", "locked_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+            {"$set": {"locked_at": now}},
+        )
+        if stale.modified_count:
+            return None
+        if time.monotonic() > deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+async def complete_idempotency_key(key: str, response: dict):
+    await db.idempotency_keys.update_one(
+        {"_id": key}, {"$set": {"state": "completed", "response": response}}
+    )
+
+def idempotent_response(body: dict, replayed: bool) -> Response:
+    return Response(
+        orjson.dumps(body),
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true" if replayed else "false"},
+    )
+
+async def run_idempotent(key: str, payload: dict, execute) -> Response:
+    # execute(key) must call complete_idempotency_key as soon as its effects
+    # are committed; anything that fails before that gives the key back
+    fingerprint = request_fingerprint(payload)
+    inflight = idempotency_inflight.get(key)
+    if inflight is not None:
+        inflight_fingerprint, future = inflight
+        if inflight_fingerprint != fingerprint:
+            raise idempotency_mismatch()
+        return idempotent_response(await asyncio.shield(future), replayed=True)
     
+    future = asyncio.get_running_loop().create_future()
+    idempotency_inflight[key] = (fingerprint, future)
+    try:
+        record = await claim_idempotency_key(key, fingerprint)
+        if record is not None:
+            body, replayed = record["response"], True
+        else:
+            try:
+                body, replayed = await execute(key), False
+            except BaseException:
+                await db.idempotency_keys.delete_one({"_id": key, "state": "started"})
+                raise
+        future.set_result(body)
+        return idempotent_response(body, replayed)
+    except BaseException as exc:
+        if not future.done():
+            future.set_exception(exc)
+            # Mark it retrieved; there may be no duplicate waiting on it
+            future.exception()
+        raise
+    finally:
+        del idempotency_inflight[key]
+
+# Order endpoints
+@api_router.post("/orders", response_model=Order)
+async def create_order(
+    order_data: OrderCreate,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+):
+    await enforce_rate_limit("checkout", request, order_data.customer.email)
+    async with route_limiters["checkout"]:
+        if idempotency_key is None:
+            return await place_order(order_data)
+        return await run_idempotent(
+            f"orders:{idempotency_key}",
+            order_data.model_dump(mode="json"),
+            lambda key: place_order(order_data, key),
+        )
+
+async def take_over_hold(hold_id: str, quantities: dict) -> Optional[str]:
+    # Returns the tag of the hold's reservation if it covers exactly this
+    # order; otherwise the hold is released and the order reserves afresh
+    hold = await db.cart_holds.find_one({"id": hold_id}, {"_id": 0, "items": 1})
+    if hold is None:
+        return None
+    if line_quantities(CartLine(**item) for item in hold["items"]) != quantities:
+        closed = await close_hold(hold_id, "released")
+        if closed:
+            await finish_hold_release([closed])
+        return None
+    if await close_hold(hold_id, "converted", require_unexpired=True) is None:
+        return None
+    return hold_tag(hold_id)
+
+async def place_order(order_data: OrderCreate, idempotency_key: Optional[str] = None) -> dict:
     order = Order(**order_data.model_dump())
+    quantities = line_quantities(order.items)
+    names = {item.product_id: item.product_name for item in order.items}
+    products_by_id = await resolve_cart(list(quantities))
+    missing = next((product_id for product_id in quantities if product_id not in products_by_id), None)
+    if missing is not None:
+        raise HTTPException(status_code=404, detail=f"Product {names[missing]} not found")
+    
+    # Names and prices come from the catalog, not from the client's cart
+    for item in order.items:
+        product = products_by_id[item.product_id]
+        item.product_name = product["name"]
+        item.price = product["price"]
+    order.total = round(sum(item.price * item.quantity for item in order.items), 2)
+    
+    tag = await take_over_hold(order_data.hold_id, quantities) if order_data.hold_id else None
+    if tag is None:
+        tag = order.id
+        await reserve_stock(tag, quantities, names, products_by_id)
+    
     order_doc = order.model_dump()
-    order_doc['created_at'] = order_doc['created_at'].isoformat()
+    order_doc["updated_at"] = order.created_at
+    order_doc["outbox"] = [
+        outbox_entry("Confirmation de votre commande", "Merci pour votre commande ! Nous l'avons bien reçue.")
+    ]
+    try:
+        await db.orders.insert_one(order_doc)
+    except Exception:
+        await release_stock(tag, quantities)
+        raise
     
-    await db.orders.insert_one(order_doc)
-    return order
+    await record_order_created(order_doc)
+    order_json = order.model_dump(mode="json")
+    # From here on the order exists, so a retry must replay it even if a
+    # later step fails
+    if idempotency_key is not None:
+        await complete_idempotency_key(idempotency_key, order_json)
+    
+    await settle_stock(tag, list(quantities))
+    if order_events.source is None:
+        publish_order_created(order_json)
+    return order_json
 
-@api_router.get("/orders", response_model=List[Order])
-async def get_orders(current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))):
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for order in orders:
-        if isinstance(order['created_at'], str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-    return orders
+def created_at_bound(value: datetime) -> datetime:
+    # Naive query parameters are taken to be UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def order_filter(
+    status: Optional[OrderStatus] = None,
+    email: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> dict:
+    query = {}
+    if status is not None:
+        query["status"] = status.value
+    if email:
+        query["customer.email"] = email
+    created_range = {}
+    if created_from is not None:
+        created_range["$gte"] = created_at_bound(created_from)
+    if created_to is not None:
+        created_range["$lt"] = created_at_bound(created_to)
+    if created_range:
+        query["created_at"] = created_range
+    return query
+
+def order_export_rows(order: dict):
+    # One flat row per line item
+    customer = order["customer"]
+    for item in order["items"]:
+        yield {
+            "order_id": order["id"],
+            "created_at": parse_created_at(order["created_at"]).isoformat(),
+            "status": order["status"],
+            "customer_name": customer["name"],
+            "customer_email": customer["email"],
+            "customer_phone": customer["phone"],
+            "customer_address": customer["address"],
+            "order_total": order["total"],
+            "product_id": item["product_id"],
+            "product_name": item["product_name"],
+            "price": item["price"],
+            "quantity": item["quantity"],
+            "line_total": round(item["price"] * item["quantity"], 2),
+        }
+
+async def export_orders(query: dict, file_format: str, compressed: bool):
+    # Oldest first; memory is bounded by one cursor batch whatever the range
+    collections = [db.orders, db.orders_archive] if archive_may_match(query) else [db.orders]
+    cursor = merge_order_cursors([
+        collection.find(query, ORDER_FIELDS)
+            .sort([("created_at", 1), ("id", 1)])
+            .batch_size(ORDERS_EXPORT_BATCH_SIZE)
+        for collection in collections
+    ])
+    # wbits=31 writes a gzip container
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compressed else None
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ORDERS_EXPORT_COLUMNS)
+    if file_format == "csv":
+        writer.writeheader()
+    
+    def drain(final: bool = False) -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor is None:
+            return data
+        return compressor.compress(data) + (compressor.flush() if final else compressor.flush(zlib.Z_SYNC_FLUSH))
+    
+    count = 0
+    async for order in cursor:
+        for row in order_export_rows(order):
+            if file_format == "csv":
+                writer.writerow(row)
+            else:
+                buffer.write(orjson.dumps(row).decode())
+                buffer.write("\n")
+        count += 1
+        if count % ORDERS_EXPORT_BATCH_SIZE == 0:
+            yield drain()
+    yield drain(final=True)
+
+@api_router.get("/orders/export")
+async def export_order_lines(
+    request: Request,
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    status: Optional[OrderStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))
+):
+    # Compressed on the fly as rows are produced; gzip streams cheaply
+    compressed = "gzip" in accepted_encodings(request)
+    headers = {
+        "Content-Disposition": f'attachment; filename="orders.{file_format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_orders(order_filter(status, None, created_from, created_to), file_format, compressed),
+        media_type="text/csv; charset=utf-8" if file_format == "csv" else "application/x-ndjson",
+        headers=headers,
+    )
+
+@api_router.get("/orders", response_model=Union[OrderPage, OrderSummaryPage])
+async def get_orders(
+    request: Request,
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[OrderStatus] = None,
+    email: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    view: OrderView = OrderView.FULL,
+    current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))
+):
+    query = order_filter(status, email, created_from, created_to)
+    if cursor:
+        value, last_id = decode_cursor(cursor, "orders")
+        query.update(keyset_filter("created_at", -1, value, last_id))
+    
+    projection = ORDER_FIELDS
+    if view == OrderView.SUMMARY:
+        # List views don't need line items; count them server-side instead
+        projection = {"_id": 0, "id": 1, "customer": 1, "total": 1, "status": 1, "created_at": 1,
+                      "item_count": {"$size": "$items"}}
+    
+    sort = [("created_at", -1), ("id", -1)]
+    if archive_may_match(query):
+        live, archived = await asyncio.gather(
+            db.orders.find(query, projection).sort(sort).to_list(limit + 1),
+            db.orders_archive.find(query, projection).sort(sort).to_list(limit + 1),
+        )
+        orders = merge_order_pages(live, archived, descending=True)[:limit + 1]
+    else:
+        orders = await db.orders.find(query, projection).sort(sort).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor("orders", orders[-1]["created_at"], orders[-1]["id"])
+    if view == OrderView.FULL:
+        fill_defaults(orders, ORDER_DEFAULTS)
+    
+    return json_response(request, orjson.dumps({"items": orders, "next_cursor": next_cursor}))
+
+@api_router.post("/orders/events/token")
+async def create_order_events_token(current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))):
+    return {"token": create_stream_token(current_user), "expires_in": ORDER_EVENTS_TOKEN_SECONDS}
+
+@api_router.get("/orders/events")
+async def order_event_stream(
+    request: Request,
+    last_event_id: Optional[str] = None,
+    current_user: User = Depends(get_stream_user),
+):
+    if current_user.role not in (UserRole.MERCHANT, UserRole.ADMIN):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    # Browsers resend the last id they saw when EventSource reconnects; a
+    # client reconnecting with a fresh stream token passes it explicitly
+    queue = order_events.subscribe(request.headers.get("last-event-id") or last_event_id)
+    
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            order_events.unsubscribe(queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/orders/{order_id}", response_model=Order)
+async def get_order(
+    order_id: str,
+    current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))
+):
+    order = await find_order(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
 
 @api_router.patch("/orders/{order_id}/status")
 async def update_order_status(
@@ -320,22 +3042,342 @@ async def update_order_status(
     status_update: OrderUpdateStatus,
     current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))
 ):
-    order = await db.orders.find_one({"id": order_id})
+    # The previous status comes back with the update, so concurrent changes
+    # each adjust the counters from the right starting point. The customer
+    # email goes into the order's outbox in the same write, only when the
+    # status actually changes.
+    new_status = status_update.status.value
+    outbox = {"$ifNull": ["$outbox", "$$REMOVE"]}
+    if status_update.status in ORDER_STATUS_EMAILS:
+        subject, intro = ORDER_STATUS_EMAILS[status_update.status]
+        outbox = {"$cond": [
+            {"$ne": ["$status", new_status]},
+            {"$concatArrays": [{"$ifNull": ["$outbox", []]}, [{"$literal": outbox_entry(subject, intro)}]]},
+            outbox,
+        ]}
+    update = [{"$set": {"status": new_status, "updated_at": datetime.now(timezone.utc), "outbox": outbox}}]
+    order = await db.orders.find_one_and_update({"id": order_id}, update, projection={"_id": 0})
+    archived = False
+    if not order:
+        order = await db.orders_archive.find_one_and_update({"id": order_id}, update, projection={"_id": 0})
+        archived = True
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    if archived and new_status not in ARCHIVED_ORDER_STATUSES:
+        await restore_archived_order(order_id)
     
-    await db.orders.update_one({"id": order_id}, {"$set": {"status": status_update.status}})
-    
-    # TODO: Send email notification to customer
-    # This will be implemented when Gmail credentials are provided
+    await record_order_status_change(order, new_status)
+    # The change stream only watches live orders; polling covers both
+    if order_events.source is None or (archived and order_events.source == "change_stream"):
+        publish_order_status(order_id, new_status)
     
     return {"message": "Order status updated", "status": status_update.status}
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
+# Stats endpoint
+@api_router.get("/stats")
+async def get_stats(
+    granularity: StatsGranularity = StatsGranularity.DAY,
+    buckets: int = Query(30, ge=1, le=STATS_MAX_BUCKETS),
+    current_user: User = Depends(require_role([UserRole.MERCHANT, UserRole.ADMIN]))
+):
+    now = datetime.now(timezone.utc)
+    step = timedelta(hours=1) if granularity == StatsGranularity.HOUR else timedelta(days=1)
+    since = stats_bucket(granularity.value, now - step * (buckets - 1))[1]
+    
+    totals, series, low_stock = await asyncio.gather(
+        db.stats.find_one({"_id": "totals"}),
+        db.revenue_series.find(
+            {"granularity": granularity.value, "start": {"$gte": since}}, {"_id": 0, "start": 1, "orders": 1, "revenue_cents": 1}
+        ).sort("start", ASCENDING).to_list(buckets),
+        db.products.find(
+            {"stock": {"$lte": LOW_STOCK_THRESHOLD}}, {"_id": 0, "id": 1, "name": 1, "stock": 1, "available": 1}
+        ).sort([("stock", ASCENDING), ("id", ASCENDING)]).to_list(LOW_STOCK_LIMIT),
+    )
+    totals = totals or {}
+    
+    # Buckets without orders have no document; fill them in for the charts
+    by_start = {bucket["start"]: bucket for bucket in series}
+    filled = []
+    start = since
+    for _ in range(buckets):
+        bucket = by_start.get(start, {})
+        filled.append({"start": start, "orders": bucket.get("orders", 0), "revenue": bucket.get("revenue_cents", 0) / 100})
+        start += step
+    
+    return {
+        "orders": totals.get("orders", 0),
+        "orders_by_status": {status.value: totals.get("orders_by_status", {}).get(status.value, 0) for status in OrderStatus},
+        "revenue": totals.get("revenue_cents", 0) / 100,
+        "products": totals.get("products", 0),
+        "products_available": totals.get("products_available", 0),
+        "low_stock": low_stock,
+        "series": {"granularity": granularity.value, "buckets": filled},
+        "reconciled_at": totals.get("reconciled_at"),
+    }
+
+# Admin endpoints
+@api_router.get("/admin/indexes")
+async def get_indexes(current_user: User = Depends(require_role([UserRole.ADMIN]))):
+    return await get_index_report()
+
+@api_router.get("/admin/runtime")
+async def get_runtime_stats(current_user: User = Depends(require_role([UserRole.ADMIN]))):
+    return {
+        "password_hasher": password_hasher.stats(),
+        "route_limiters": {name: limiter.stats() for name, limiter in route_limiters.items()},
+    }
+
+@api_router.put("/admin/products/{product_id}/stock-shards")
+async def set_stock_shards(
+    product_id: str,
+    shards: int = Query(..., ge=0, le=STOCK_SHARDS_MAX),
+    current_user: User = Depends(require_role([UserRole.ADMIN]))
+):
+    # Meant to be run ahead of a sale; 0 moves the stock back onto the product
+    product = await db.products.find_one(
+        {"id": product_id}, {"_id": 0, "stock": 1, "stock_shards": 1, "pending_orders": 1}
+    )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    existing = await db.stock_shards.find({"product_id": product_id}, {"_id": 0}).to_list(None)
+    if product.get("pending_orders") or any(shard.get("pending_orders") for shard in existing):
+        raise HTTPException(
+            status_code=409,
+            detail="Product has reservations in progress",
+            headers={"Retry-After": str(CART_HOLD_SWEEP_INTERVAL)},
+        )
+    
+    total = sum(shard["stock"] for shard in existing) if product.get("stock_shards") else product["stock"]
+    await db.stock_shards.delete_many({"product_id": product_id})
+    if shards:
+        await db.stock_shards.insert_many([
+            {"product_id": product_id, "shard": shard, "stock": stock, "pending_orders": []}
+            for shard, stock in enumerate(split_stock(total, shards))
+        ])
+    await db.products.update_one({"id": product_id}, {"$set": {"stock": total, "stock_shards": shards}})
+    await bump_catalog_version()
+    return {"id": product_id, "stock": total, "stock_shards": shards}
+
+@api_router.post("/admin/uploads/gc")
+async def collect_uploads(
+    dry_run: bool = False,
+    current_user: User = Depends(require_role([UserRole.ADMIN]))
+):
+    return await collect_unreferenced_uploads(dry_run)
+
+# Metrics endpoint, outside /api so scrapers don't need an app token
+def render_metrics() -> str:
+    hasher = password_hasher.stats()
+    lines = []
+    for metric in (http_request_duration, http_response_size, http_responses, db_command_duration, db_command_failures):
+        lines.extend(metric.render())
+    lines.extend(render_gauge("http_requests_in_flight", "Requests being served", runtime_gauges["http_requests_in_flight"]))
+    lines.extend(render_gauge(
+        "event_loop_lag_seconds", "Delay of the last event loop wakeup", runtime_gauges["event_loop_lag_seconds"]
+    ))
+    lines.extend(render_gauge("password_hash_queued", "bcrypt jobs waiting for a worker", hasher["queued"]))
+    lines.extend(render_gauge("password_hash_active", "bcrypt jobs running", hasher["active"]))
+    lines.extend(render_gauge("password_hash_workers", "bcrypt worker threads", hasher["workers"]))
+    for name, help_text in (("active", "Requests holding a route concurrency slot"), ("queued", "Requests waiting for a slot")):
+        lines += [f"# HELP route_limiter_{name} {help_text}", f"# TYPE route_limiter_{name} gauge"]
+        lines += [
+            f"route_limiter_{name}{format_labels(('route',), (route,))} {limiter.stats()[name]}"
+            for route, limiter in route_limiters.items()
+        ]
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Reject oversized uploads before the multipart body is parsed; a plain ASGI
+# middleware so other requests, event streams included, pass straight through
+class UploadSizeMiddleware:
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/api/products":
+            content_length = Headers(scope=scope).get("content-length")
+            # Leave room for the other form fields and multipart framing
+            if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+                response = JSONResponse(status_code=413, content={"detail": "Image too large"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Latency, size and status per route, plus the DB time breakdown of slow requests
+def route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"].startswith("/uploads/"):
+        return "/uploads"
+    # Unmatched paths share one label so scanners can't blow up cardinality
+    return "unmatched"
+
+def log_slow_request(method: str, path: str, status_code: int, elapsed: float, timings: list):
+    breakdown = {}
+    for collection, command, seconds in timings:
+        entry = breakdown.setdefault(f"{collection}.{command}", [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    db_seconds = sum(seconds for _, seconds in breakdown.values())
+    details = ", ".join(
+        f"{name} {count}x {seconds * 1000:.1f}ms"
+        for name, (count, seconds) in sorted(breakdown.items(), key=lambda item: -item[1][1])
+    )
+    logger.warning(
+        "Slow request %s %s -> %s in %.1fms (db %.1fms%s)",
+        method, path, status_code, elapsed * 1000, db_seconds * 1000, f": {details}" if details else "",
+    )
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        response = {"status": 500, "size": 0, "content_length": None, "stream": False}
+        timings = []
+        
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-length":
+                        response["content_length"] = int(value)
+                    elif name == b"content-type" and value.startswith(b"text/event-stream"):
+                        response["stream"] = True
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+        
+        token = request_db_timings.set(timings)
+        runtime_gauges["http_requests_in_flight"] += 1
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            runtime_gauges["http_requests_in_flight"] -= 1
+            request_db_timings.reset(token)
+            elapsed = time.perf_counter() - started
+            labels = (scope["method"], route_label(scope))
+            http_responses.inc(labels + (response["status"],))
+            # Event streams stay open for minutes; their duration isn't latency
+            if not response["stream"]:
+                http_request_duration.observe(labels, elapsed)
+                size = response["content_length"] if response["content_length"] is not None else response["size"]
+                http_response_size.observe(labels, size)
+                if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+                    log_slow_request(scope["method"], scope["path"], response["status"], elapsed, timings)
+
+async def monitor_event_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        runtime_gauges["event_loop_lag_seconds"] = max(0.0, loop.time() - started - EVENT_LOOP_LAG_INTERVAL)
+
+# Static uploads
+def parse_byte_range(range_header: str, size: int):
+    # Single "bytes=" ranges only; anything else is ignored and the full file sent
+    units, _, spec = range_header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    return start, end
+
+class FileRangeResponse(Response):
+    chunk_size = 64 * 1024
+    
+    def __init__(self, path: str, start: int, end: int, size: int, headers: dict, method: str):
+        super().__init__(status_code=206, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = method != "HEAD"
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+    
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class UploadFiles(StaticFiles):
+    # Full-file responses go through FileResponse, which hands the path to the
+    # server for zero-copy transfer when it supports the ASGI pathsend extension
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        name = os.path.basename(full_path)
+        
+        negotiable = UPLOADS_NEGOTIATE_WEBP and full_path.startswith(str(IMAGE_VARIANTS_DIR)) and name.endswith(".jpg")
+        if negotiable and "image/webp" in request_headers.get("accept", ""):
+            webp_path = full_path[:-len(".jpg")] + ".webp"
+            if os.path.isfile(webp_path):
+                full_path, stat_result = webp_path, os.stat(webp_path)
+                name = os.path.basename(webp_path)
+        
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope["method"])
+        if CONTENT_ADDRESSED_UPLOAD_NAME.match(name):
+            response.headers["etag"] = f'"{name}"'
+        if IMMUTABLE_UPLOAD_NAME.match(name):
+            response.headers["cache-control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["cache-control"] = "public, no-cache"
+        response.headers["accept-ranges"] = "bytes"
+        if negotiable:
+            response.headers["vary"] = "Accept"
+        
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and status_code == 200 and (if_range is None or if_range == response.headers["etag"]):
+            size = stat_result.st_size
+            byte_range = parse_byte_range(range_header, size)
+            if byte_range is not None:
+                start, end = byte_range
+                if start > end or start >= size:
+                    return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+                headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+                return FileRangeResponse(full_path, start, end, size, headers, scope["method"])
+        return response
+
+app.mount("/uploads", UploadFiles(directory=str(UPLOADS_DIR)), name="uploads")
 
 app.include_router(api_router)
 
+app.add_middleware(UploadSizeMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -344,12 +3386,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last so it wraps everything else, CORS and error responses included
+app.add_middleware(MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_catalog_cache():
+    app.state.catalog_version_task = asyncio.create_task(watch_versions())
+
+@app.on_event("startup")
+async def start_order_events():
+    app.state.order_changes_task = asyncio.create_task(watch_order_changes())
+
+@app.on_event("startup")
+async def start_notification_worker():
+    app.state.notification_task = asyncio.create_task(run_notification_worker())
+
+@app.on_event("startup")
+async def start_hold_sweeper():
+    app.state.hold_sweeper_task = asyncio.create_task(run_hold_sweeper())
+
+@app.on_event("startup")
+async def start_stats_reconciler():
+    app.state.stats_task = asyncio.create_task(run_stats_reconciler())
+
+@app.on_event("startup")
+async def start_order_archiver():
+    app.state.order_archive_task = asyncio.create_task(run_order_archiver())
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    app.state.event_loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+    report = await get_index_report()
+    for collection, info in report["collections"].items():
+        for name in info["missing"]:
+            logger.warning("%s: missing index %s", collection, name)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.catalog_version_task.cancel()
+    app.state.order_changes_task.cancel()
+    app.state.notification_task.cancel()
+    app.state.event_loop_lag_task.cancel()
+    app.state.hold_sweeper_task.cancel()
+    app.state.stats_task.cancel()
+    app.state.order_archive_task.cancel()
+    password_hasher.shutdown()
+    if image_pool is not None:
+        image_pool.shutdown(wait=False)
     client.close()
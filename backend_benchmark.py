@@ -0,0 +1,345 @@
+"""Local load-testing harness for the backend API.
+
+Starts backend/server.py under uvicorn against a throwaway mongod (or an
+existing server given with --mongo-url, using a scratch database), seeds
+a catalog and order history, then replays a mixed workload with asyncio
+concurrency and reports throughput and p50/p95/p99 latency per route.
+Results are written as JSON so runs can be compared between commits.
+
+All traffic comes from one IP and a few accounts, so the API is started
+with rate and concurrency limits far above the workload; --rate-limits
+keeps the server defaults, and rate-limited (429) responses are reported
+in their own column either way.
+
+Usage:
+    python backend_benchmark.py --duration 30 --concurrency 64 --products 20000 --orders 50000
+    python backend_benchmark.py --compare bench_results/previous.json
+    python backend_benchmark.py --rate-limits --mix login=50,checkout=50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from passlib.context import CryptContext
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+RESULTS_DIR = ROOT_DIR / "bench_results"
+
+ADMIN = {"email": "admin@shop.com", "password": "admin123"}
+MERCHANT = {"email": "commercante@shop.com", "password": "merchant123"}
+
+# Relative weight of each scenario in the mixed workload
+DEFAULT_MIX = {"browse": 50, "detail": 25, "checkout": 10, "dashboard": 10, "login": 5}
+
+# Server environment that takes the per-IP/per-account rate limits and the
+# per-route concurrency caps out of the way of a single-host load test
+RAISED_LIMITS = {
+    "RATE_LIMIT_LOGIN_IP": "1000000/1",
+    "RATE_LIMIT_LOGIN_ACCOUNT": "1000000/1",
+    "RATE_LIMIT_CHECKOUT_IP": "1000000/1",
+    "RATE_LIMIT_CHECKOUT_ACCOUNT": "1000000/1",
+    "LOGIN_CONCURRENCY": "4096",
+    "LOGIN_MAX_QUEUE": "4096",
+    "CHECKOUT_CONCURRENCY": "4096",
+    "CHECKOUT_MAX_QUEUE": "4096",
+}
+
+WORDS = ["chaussures", "été", "sac", "cuir", "montre", "élégant", "coton", "robe", "bijou", "lampe", "café", "bois"]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+class Environment:
+    """Throwaway mongod + uvicorn pair, torn down on exit"""
+
+    def __init__(self, mongo_url=None, workers=1, rate_limits=False):
+        self.mongo_url = mongo_url
+        self.workers = workers
+        self.rate_limits = rate_limits
+        self.db_name = f"bench_{uuid.uuid4().hex[:8]}"
+        self.processes = []
+        self.tmpdir = None
+        self.api_port = free_port()
+
+    def start_mongod(self):
+        mongod = shutil.which("mongod")
+        if mongod is None:
+            raise RuntimeError("mongod not found on PATH; pass --mongo-url to use an existing server")
+        self.tmpdir = tempfile.mkdtemp(prefix="bench-mongo-")
+        port = free_port()
+        self.processes.append(subprocess.Popen(
+            [mongod, "--dbpath", self.tmpdir, "--port", str(port), "--bind_ip", "127.0.0.1", "--nounixsocket", "--quiet"],
+            stdout=subprocess.DEVNULL,
+        ))
+        wait_for_port(port)
+        self.mongo_url = f"mongodb://127.0.0.1:{port}"
+
+    def start_api(self):
+        env = dict(os.environ, MONGO_URL=self.mongo_url, DB_NAME=self.db_name)
+        if not self.rate_limits:
+            env.update(RAISED_LIMITS)
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(self.api_port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+        ))
+        wait_for_port(self.api_port)
+
+    def __enter__(self):
+        if self.mongo_url is None:
+            self.start_mongod()
+        return self
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+        else:
+            MongoClient(self.mongo_url).drop_database(self.db_name)
+
+def seed(mongo_url, db_name, products, orders):
+    db = MongoClient(mongo_url, tz_aware=True)[db_name]
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    now = datetime.now(timezone.utc)
+
+    db.users.insert_many([
+        {"id": str(uuid.uuid4()), "email": account["email"], "role": role,
+         "password": pwd_context.hash(account["password"]), "created_at": now}
+        for account, role in ((ADMIN, "admin"), (MERCHANT, "merchant"))
+    ])
+
+    catalog = []
+    for i in range(products):
+        catalog.append({
+            "id": str(uuid.uuid4()),
+            "name": f"{random.choice(WORDS).capitalize()} {random.choice(WORDS)} {i}",
+            "description": " ".join(random.choices(WORDS, k=20)),
+            "price": round(random.uniform(5, 500), 2),
+            "image_url": f"/uploads/{uuid.uuid4().hex}.jpg",
+            # Enough stock that checkouts rarely sell out during a run
+            "stock": 1_000_000,
+            "available": True,
+            "image_variants": {},
+            "created_at": now - timedelta(seconds=i),
+        })
+    for start in range(0, len(catalog), 5000):
+        db.products.insert_many(catalog[start:start + 5000])
+
+    history = []
+    for i in range(orders):
+        items = [
+            {"product_id": p["id"], "product_name": p["name"], "price": p["price"], "quantity": random.randint(1, 3)}
+            for p in random.sample(catalog, k=min(len(catalog), random.randint(1, 4)))
+        ]
+        history.append({
+            "id": str(uuid.uuid4()),
+            "customer": {"name": f"Client {i}", "email": f"client{i % 5000}@test.com",
+                         "phone": "0123456789", "address": "123 Rue Test, Paris"},
+            "items": items,
+            "total": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "status": random.choice(["pending", "accepted", "refused", "completed"]),
+            "created_at": now - timedelta(minutes=i),
+        })
+        if len(history) == 5000:
+            db.orders.insert_many(history)
+            history = []
+    if history:
+        db.orders.insert_many(history)
+    return [p["id"] for p in catalog], {p["id"]: p for p in random.sample(catalog, k=min(len(catalog), 500))}
+
+class Workload:
+    def __init__(self, client, product_ids, sample_products, merchant_token):
+        self.client = client
+        self.product_ids = product_ids
+        self.sample_products = list(sample_products.values())
+        self.merchant_token = merchant_token
+        self.latencies = {}
+        self.errors = {}
+        self.limited = {}
+
+    async def request(self, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            response, ok = None, False
+        elapsed = (time.perf_counter() - started) * 1000
+        if response is not None and response.status_code == 429:
+            # Rejected before doing any work; kept out of the latency samples
+            self.limited[route] = self.limited.get(route, 0) + 1
+            return response
+        self.latencies.setdefault(route, []).append(elapsed)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    async def browse(self):
+        response = await self.request("GET /api/products", "GET", "/api/products", params={"available": "true"})
+        if response is not None and response.status_code == 200 and random.random() < 0.3:
+            cursor = response.json().get("next_cursor")
+            if cursor:
+                await self.request("GET /api/products?cursor", "GET", "/api/products",
+                                   params={"available": "true", "cursor": cursor})
+        if random.random() < 0.2:
+            await self.request("GET /api/products/search", "GET", "/api/products/search",
+                               params={"q": random.choice(WORDS)[:3]})
+
+    async def detail(self):
+        product_id = random.choice(self.product_ids)
+        await self.request("GET /api/products/{id}", "GET", f"/api/products/{product_id}")
+
+    async def checkout(self):
+        products = random.sample(self.sample_products, k=random.randint(1, 3))
+        items = [{"product_id": p["id"], "product_name": p["name"], "price": p["price"], "quantity": 1} for p in products]
+        await self.request("POST /api/orders", "POST", "/api/orders", json={
+            "customer": {"name": "Bench", "email": "bench@test.com", "phone": "0123456789", "address": "Paris"},
+            "items": items,
+            "total": round(sum(p["price"] for p in products), 2),
+        })
+
+    async def dashboard(self):
+        params = {"view": "summary"}
+        if random.random() < 0.5:
+            params["status"] = random.choice(["pending", "accepted"])
+        await self.request("GET /api/orders", "GET", "/api/orders", params=params,
+                           headers={"Authorization": f"Bearer {self.merchant_token}"})
+
+    async def login(self):
+        await self.request("POST /api/auth/login", "POST", "/api/auth/login", json=random.choice([ADMIN, MERCHANT]))
+
+async def run_workload(base_url, product_ids, sample_products, args):
+    mix = DEFAULT_MIX.copy()
+    for part in args.mix.split(",") if args.mix else []:
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight)
+    scenarios = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in scenarios]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        response = await client.post("/api/auth/login", json=MERCHANT)
+        response.raise_for_status()
+        workload = Workload(client, product_ids, sample_products, response.json()["token"])
+
+        deadline = time.monotonic() + args.duration
+
+        async def user():
+            while time.monotonic() < deadline:
+                await getattr(workload, random.choices(scenarios, weights)[0])()
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+
+    routes = {}
+    for route in sorted(workload.latencies.keys() | workload.limited.keys()):
+        samples = workload.latencies.get(route, [])
+        routes[route] = {
+            "requests": len(samples),
+            "errors": workload.errors.get(route, 0),
+            "rate_limited": workload.limited.get(route, 0),
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+        }
+    return {"elapsed_s": round(elapsed, 2), "routes": routes}
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(results, previous=None):
+    print(f"\n📊 {results['revision']}: {results['config']['concurrency']} clients, {results['elapsed_s']}s")
+    print(f"   {'route':<30} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7} {'429':>7}")
+    for route, stats in results["routes"].items():
+        line = (f"   {route:<30} {stats['throughput']:>8} {stats['p50_ms']:>8} "
+                f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7} {stats.get('rate_limited', 0):>7}")
+        before = (previous or {}).get("routes", {}).get(route)
+        if before and before["p99_ms"]:
+            change = (stats["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+            line += f"   p99 {change:+.0f}% vs {previous['revision']}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help="use this server (with a scratch database) instead of starting mongod")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", help="scenario weights, e.g. browse=60,checkout=20,login=0")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep the server's default rate and concurrency limits")
+    args = parser.parse_args()
+
+    print("🚀 Starting API benchmark")
+    print("=" * 50)
+
+    with Environment(args.mongo_url, args.workers, args.rate_limits) as env:
+        print(f"   Seeding {args.products} products and {args.orders} orders into {env.db_name}...")
+        product_ids, sample_products = seed(env.mongo_url, env.db_name, args.products, args.orders)
+        env.start_api()
+        print(f"   Running mixed workload for {args.duration}s...")
+        results = asyncio.run(run_workload(f"http://127.0.0.1:{env.api_port}", product_ids, sample_products, args))
+
+    results.update({
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "mongo_url")},
+    })
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json"
+    path.write_text(json.dumps(results, indent=2))
+
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, previous)
+    print(f"\n   Results written to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import requests
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class LoginBurstBenchmark:
+    def __init__(self, base_url="http://localhost:8001", duration=10, readers=8, login_clients=32):
+        self.api_url = f"{base_url}/api"
+        self.duration = duration
+        self.readers = readers
+        self.login_clients = login_clients
+
+    def read_products(self, stop, latencies):
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = session.get(f"{self.api_url}/products")
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    def login(self, stop, statuses):
+        session = requests.Session()
+        while not stop.is_set():
+            response = session.post(f"{self.api_url}/auth/login", json={"email": "admin@shop.com", "password": "admin123"})
+            statuses.append(response.status_code)
+
+    def phase(self, with_logins):
+        stop = threading.Event()
+        latencies = []
+        statuses = []
+        workers = self.readers + (self.login_clients if with_logins else 0)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in range(self.readers):
+                pool.submit(self.read_products, stop, latencies)
+            if with_logins:
+                for _ in range(self.login_clients):
+                    pool.submit(self.login, stop, statuses)
+            time.sleep(self.duration)
+            stop.set()
+        return latencies, statuses
+
+    def report(self, name, latencies, statuses):
+        print(f"\n📊 {name}")
+        print(f"   GET /api/products: {len(latencies)} requests, "
+              f"p50 {percentile(latencies, 50):.1f} ms, "
+              f"p95 {percentile(latencies, 95):.1f} ms, "
+              f"p99 {percentile(latencies, 99):.1f} ms")
+        if statuses:
+            ok, shed, limited = statuses.count(200), statuses.count(503), statuses.count(429)
+            print(f"   POST /api/auth/login: {ok} ok, {shed} shed, {limited} rate limited, "
+                  f"{len(statuses) - ok - shed - limited} other")
+            if limited:
+                print("   ⚠️  The server is rate limiting logins, so the burst never reaches bcrypt; "
+                      "raise RATE_LIMIT_LOGIN_IP/RATE_LIMIT_LOGIN_ACCOUNT or run with --local")
+
+    def run(self):
+        """Compare catalog read latency with and without a concurrent login burst"""
+        self.report("Baseline (reads only)", *self.phase(with_logins=False))
+        self.report(f"Login burst ({self.login_clients} clients)", *self.phase(with_logins=True))
+        return 0
+
+def main():
+    print("🚀 Starting login burst benchmark")
+    print("=" * 50)
+
+    if "--local" in sys.argv[1:]:
+        # Throwaway mongod + API with the login rate limits raised out of the way
+        from backend_benchmark import Environment, seed
+
+        with Environment() as env:
+            seed(env.mongo_url, env.db_name, products=1000, orders=0)
+            env.start_api()
+            return LoginBurstBenchmark(f"http://127.0.0.1:{env.api_port}").run()
+
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8001"
+    return LoginBurstBenchmark(base_url).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
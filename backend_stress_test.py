@@ -0,0 +1,114 @@
+import requests
+import sys
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+class StockStressTester:
+    def __init__(self, base_url="https://smartshop-57.preview.emergentagent.com", stock=20, buyers=200):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.stock = stock
+        self.buyers = buyers
+        self.admin_token = None
+        self.product_id = None
+
+    def admin_login(self):
+        response = requests.post(f"{self.api_url}/auth/login", json={"email": "admin@shop.com", "password": "admin123"})
+        response.raise_for_status()
+        self.admin_token = response.json()['token']
+
+    def create_product(self):
+        from PIL import Image
+
+        img = Image.new('RGB', (100, 100), color='blue')
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='JPEG')
+        img_bytes.seek(0)
+
+        response = requests.post(
+            f"{self.api_url}/products",
+            data={'name': 'Produit Flash', 'description': 'Vente flash', 'price': '9.99', 'stock': str(self.stock)},
+            files={'image': ('flash.jpg', img_bytes, 'image/jpeg')},
+            headers={'Authorization': f'Bearer {self.admin_token}'}
+        )
+        response.raise_for_status()
+        self.product_id = response.json()['id']
+
+    def place_order(self, buyer):
+        order_data = {
+            "customer": {
+                "name": f"Client {buyer}",
+                "email": f"client{buyer}@test.com",
+                "phone": "0123456789",
+                "address": "123 Rue Test, Paris"
+            },
+            "items": [
+                {"product_id": self.product_id, "product_name": "Produit Flash", "price": 9.99, "quantity": 1}
+            ],
+            "total": 9.99
+        }
+        return requests.post(f"{self.api_url}/orders", json=order_data).status_code
+
+    def get_product(self):
+        response = requests.get(f"{self.api_url}/products/{self.product_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def delete_product(self):
+        requests.delete(f"{self.api_url}/products/{self.product_id}", headers={'Authorization': f'Bearer {self.admin_token}'})
+
+    def run(self):
+        """Fire concurrent single-unit orders at one product and check nothing is oversold"""
+        self.admin_login()
+        self.create_product()
+        print(f"🔍 {self.buyers} concurrent buyers for {self.stock} units of {self.product_id}...")
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.buyers, 64)) as pool:
+                statuses = list(pool.map(self.place_order, range(self.buyers)))
+
+            accepted = statuses.count(200)
+            rejected = statuses.count(400)
+            errors = len(statuses) - accepted - rejected
+            product = self.get_product()
+
+            print(f"   Accepted: {accepted}, rejected: {rejected}, errors: {errors}")
+            if statuses.count(429) or statuses.count(503):
+                print(f"   ⚠️  {statuses.count(429)} rate limited and {statuses.count(503)} shed: start the server with "
+                      f"raised RATE_LIMIT_CHECKOUT_* and CHECKOUT_* limits, or run with --local")
+            print(f"   Final stock: {product['stock']}, available: {product['available']}")
+
+            checks = [
+                ("no more orders than stock", accepted <= self.stock),
+                ("every unit sold", accepted == min(self.stock, self.buyers)),
+                ("stock matches accepted orders", product['stock'] == self.stock - accepted),
+                ("stock never negative", product['stock'] >= 0),
+                ("sold out product is unavailable", product['stock'] > 0 or not product['available']),
+                ("no server errors", errors == 0),
+            ]
+            failed = [name for name, ok in checks if not ok]
+            for name, ok in checks:
+                print(f"{'✅' if ok else '❌'} {name}")
+            return 1 if failed else 0
+        finally:
+            self.delete_product()
+
+def main():
+    print("🚀 Starting stock reservation stress test")
+    print("=" * 50)
+
+    if "--local" in sys.argv[1:]:
+        # Throwaway mongod + API; every buyer comes from this host, so the
+        # checkout rate and concurrency limits are raised out of the way
+        from backend_benchmark import Environment, seed
+
+        with Environment() as env:
+            seed(env.mongo_url, env.db_name, products=0, orders=0)
+            env.start_api()
+            return StockStressTester(f"http://127.0.0.1:{env.api_port}").run()
+
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "https://smartshop-57.preview.emergentagent.com"
+    return StockStressTester(base_url).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
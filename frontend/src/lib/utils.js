@@ -4,3 +4,9 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs) {
   return twMerge(clsx(inputs));
 }
+
+// Resized rendition of a product image, falling back to the original upload
+export function productImageUrl(product, size, format = "jpeg") {
+  const variant = product.image_variants?.[size]?.[format];
+  return `${process.env.REACT_APP_BACKEND_URL}${variant || product.image_url}`;
+}
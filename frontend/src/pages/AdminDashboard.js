@@ -8,12 +8,14 @@ import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import { API } from '@/App';
+import { productImageUrl } from '@/lib/utils';
 import { toast } from 'sonner';
 
 const AdminDashboard = ({ auth }) => {
   const navigate = useNavigate();
   const [products, setProducts] = useState([]);
-  const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [stats, setStats] = useState(null);
   const [showAddDialog, setShowAddDialog] = useState(false);
   const [newProduct, setNewProduct] = useState({
     name: '',
@@ -25,24 +27,26 @@ const AdminDashboard = ({ auth }) => {
 
   useEffect(() => {
     fetchProducts();
-    fetchOrders();
+    fetchStats();
   }, []);
 
-  const fetchProducts = async () => {
+  const fetchProducts = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      const response = await axios.get(`${API}/products`, { params: { cursor } });
+      const { items, next_cursor } = response.data;
+      setProducts(prev => cursor ? [...prev, ...items] : items);
+      setNextCursor(next_cursor);
     } catch (error) {
       toast.error('Erreur lors du chargement des produits');
     }
   };
 
-  const fetchOrders = async () => {
+  const fetchStats = async () => {
     try {
-      const response = await axios.get(`${API}/orders`);
-      setOrders(response.data);
+      const response = await axios.get(`${API}/stats`);
+      setStats(response.data);
     } catch (error) {
-      toast.error('Erreur lors du chargement des commandes');
+      toast.error('Erreur lors du chargement des statistiques');
     }
   };
 
@@ -64,6 +68,7 @@ const AdminDashboard = ({ auth }) => {
       setShowAddDialog(false);
       setNewProduct({ name: '', description: '', price: '', stock: '', image: null });
       fetchProducts();
+      fetchStats();
     } catch (error) {
       toast.error('Erreur lors de l\'ajout du produit');
     }
@@ -75,7 +80,8 @@ const AdminDashboard = ({ auth }) => {
     try {
       await axios.delete(`${API}/products/${productId}`);
       toast.success('Produit supprimé');
-      fetchProducts();
+      setProducts(prev => prev.filter(p => p.id !== productId));
+      fetchStats();
     } catch (error) {
       toast.error('Erreur lors de la suppression');
     }
@@ -188,7 +194,7 @@ const AdminDashboard = ({ auth }) => {
           {products.map(product => (
             <div key={product.id} className="bg-white rounded-2xl overflow-hidden shadow-lg border border-gray-100" data-testid={`admin-product-${product.id}`}>
               <img 
-                src={`${process.env.REACT_APP_BACKEND_URL}${product.image_url}`}
+                src={productImageUrl(product, 'card')}
                 alt={product.name}
                 className="w-full h-48 object-cover"
                 data-testid={`admin-product-image-${product.id}`}
@@ -222,24 +228,45 @@ const AdminDashboard = ({ auth }) => {
           ))}
         </div>
 
+        {nextCursor && (
+          <div className="text-center mt-8">
+            <Button onClick={() => fetchProducts(nextCursor)} variant="outline" data-testid="admin-load-more-products-btn">
+              Voir plus de produits
+            </Button>
+          </div>
+        )}
+
         <div className="mt-12">
           <h2 className="text-3xl font-bold text-gray-900 mb-6">Statistiques</h2>
           <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
             <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100" data-testid="stats-total-products">
               <p className="text-gray-600 mb-2">Total Produits</p>
-              <p className="text-4xl font-bold text-blue-600">{products.length}</p>
+              <p className="text-4xl font-bold text-blue-600">{stats?.products ?? '–'}</p>
             </div>
             <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100" data-testid="stats-total-orders">
               <p className="text-gray-600 mb-2">Total Commandes</p>
-              <p className="text-4xl font-bold text-green-600">{orders.length}</p>
+              <p className="text-4xl font-bold text-green-600">{stats?.orders ?? '–'}</p>
             </div>
             <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100" data-testid="stats-total-revenue">
               <p className="text-gray-600 mb-2">Revenu Total</p>
               <p className="text-4xl font-bold text-purple-600">
-                {orders.reduce((sum, order) => sum + order.total, 0).toFixed(2)}€
+                {stats ? `${stats.revenue.toFixed(2)}€` : '–'}
               </p>
             </div>
           </div>
+          {stats?.low_stock.length > 0 && (
+            <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100 mt-6" data-testid="stats-low-stock">
+              <p className="text-gray-600 mb-4">Stock faible</p>
+              <ul className="space-y-2">
+                {stats.low_stock.map(product => (
+                  <li key={product.id} className="flex justify-between">
+                    <span className="text-gray-900">{product.name}</span>
+                    <span className="font-semibold text-red-600">{product.stock}</span>
+                  </li>
+                ))}
+              </ul>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -1,8 +1,11 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
+import axios from 'axios';
 import { Trash2, Plus, Minus, ShoppingBag, ArrowLeft } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { toast } from 'sonner';
+import { productImageUrl } from '@/lib/utils';
+import { API } from '@/App';
 
 const CartPage = ({ auth }) => {
   const [cart, setCart] = useState([]);
@@ -12,10 +15,32 @@ const CartPage = ({ auth }) => {
     loadCart();
   }, []);
 
-  const loadCart = () => {
+  const loadCart = async () => {
     const savedCart = localStorage.getItem('cart');
-    if (savedCart) {
-      setCart(JSON.parse(savedCart));
+    if (!savedCart) return;
+    const items = JSON.parse(savedCart);
+    setCart(items);
+    if (items.length === 0) return;
+
+    // Refresh prices and stock from the server in one request
+    try {
+      const response = await axios.post(`${API}/cart/validate`, {
+        items: items.map(item => ({ product_id: item.id, quantity: item.quantity }))
+      });
+      const lines = Object.fromEntries(response.data.items.map(line => [line.product_id, line]));
+      const refreshed = items
+        .filter(item => lines[item.id]?.found)
+        .map(item => {
+          const line = lines[item.id];
+          return { ...item, name: line.name, price: line.price, stock: line.stock, available: line.available };
+        });
+      if (!response.data.valid) {
+        toast.warning('Certains articles ne sont plus disponibles en quantité suffisante');
+      }
+      setCart(refreshed);
+      localStorage.setItem('cart', JSON.stringify(refreshed));
+    } catch (error) {
+      // Keep the saved cart; the order is checked again when placed
     }
   };
 
@@ -80,7 +105,7 @@ const CartPage = ({ auth }) => {
                   data-testid={`cart-item-${item.id}`}
                 >
                   <img 
-                    src={`${process.env.REACT_APP_BACKEND_URL}${item.image_url}`}
+                    src={productImageUrl(item, 'thumb')}
                     alt={item.name}
                     className="w-24 h-24 rounded-xl object-cover"
                     data-testid={`cart-item-image-${item.id}`}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { ArrowLeft, CheckCircle } from 'lucide-react';
@@ -20,16 +20,67 @@ const CheckoutPage = ({ auth }) => {
     phone: '',
     address: ''
   });
+  // A retry of the same order reuses its Idempotency-Key, so a request that
+  // timed out but went through is not placed twice
+  const lastAttempt = useRef(null);
+  // Stock held for this cart while the form is filled in; released if the
+  // customer leaves without ordering, and by the server once it expires
+  const hold = useRef(null);
+  // Hold requests and releases run one after the other, so a hold still
+  // being placed or released (StrictMode remounts, quick navigation) never
+  // competes with the next one for the same stock
+  const holdQueue = useRef(Promise.resolve());
 
   useEffect(() => {
     const savedCart = localStorage.getItem('cart');
     if (!savedCart || JSON.parse(savedCart).length === 0) {
       navigate('/cart');
-    } else {
-      setCart(JSON.parse(savedCart));
+      return;
     }
+    const items = JSON.parse(savedCart);
+    setCart(items);
+
+    let active = true;
+    holdQueue.current = holdQueue.current.then(async () => {
+      if (!active) return;
+      const held = await holdCart(items, () => active);
+      if (!held) return;
+      if (active) {
+        hold.current = held;
+      } else {
+        // Unmounted while the hold was being placed
+        await releaseHold(held);
+      }
+    });
+    return () => {
+      active = false;
+      const held = hold.current;
+      hold.current = null;
+      if (held) {
+        holdQueue.current = holdQueue.current.then(() => releaseHold(held));
+      }
+    };
   }, []);
 
+  const releaseHold = (held) => axios.delete(`${API}/cart/holds/${held.id}`).catch(() => {});
+
+  const holdCart = async (items, isActive) => {
+    try {
+      const response = await axios.post(`${API}/cart/holds`, {
+        items: items.map(item => ({ product_id: item.id, quantity: item.quantity }))
+      });
+      return response.data;
+    } catch (error) {
+      const status = error.response?.status;
+      if (isActive() && (status === 400 || status === 404)) {
+        toast.error(error.response.data.detail);
+        navigate('/cart');
+      }
+      // Otherwise stock is simply reserved when the order is placed
+      return null;
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setLoading(true);
@@ -43,10 +94,19 @@ const CheckoutPage = ({ auth }) => {
           price: item.price,
           quantity: item.quantity
         })),
-        total: cart.reduce((sum, item) => sum + item.price * item.quantity, 0)
+        total: cart.reduce((sum, item) => sum + item.price * item.quantity, 0),
+        hold_id: hold.current?.id
       };
 
-      await axios.post(`${API}/orders`, orderData);
+      const payload = JSON.stringify(orderData);
+      if (lastAttempt.current?.payload !== payload) {
+        lastAttempt.current = { payload, key: crypto.randomUUID() };
+      }
+
+      await axios.post(`${API}/orders`, orderData, {
+        headers: { 'Idempotency-Key': lastAttempt.current.key }
+      });
+      hold.current = null;
       localStorage.removeItem('cart');
       setOrderPlaced(true);
       toast.success('Commande passée avec succès!');
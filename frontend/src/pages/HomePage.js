@@ -1,14 +1,19 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { Link, useNavigate } from 'react-router-dom';
-import { ShoppingCart, User, LogOut, Package, Settings } from 'lucide-react';
+import { ShoppingCart, User, LogOut, Package, Settings, Search } from 'lucide-react';
 import { Button } from '@/components/ui/button';
+import { Input } from '@/components/ui/input';
 import { Badge } from '@/components/ui/badge';
 import { API } from '@/App';
+import { productImageUrl } from '@/lib/utils';
 import { toast } from 'sonner';
 
 const HomePage = ({ auth }) => {
   const [products, setProducts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [query, setQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   const [cart, setCart] = useState([]);
   const navigate = useNavigate();
 
@@ -17,15 +22,35 @@ const HomePage = ({ auth }) => {
     loadCart();
   }, []);
 
-  const fetchProducts = async () => {
+  const fetchProducts = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data.filter(p => p.available));
+      const response = await axios.get(`${API}/products`, { params: { available: true, cursor } });
+      const { items, next_cursor } = response.data;
+      setProducts(prev => cursor ? [...prev, ...items] : items);
+      setNextCursor(next_cursor);
     } catch (error) {
       toast.error('Erreur lors du chargement des produits');
     }
   };
 
+  useEffect(() => {
+    if (!query.trim()) {
+      setSearchResults(null);
+      return;
+    }
+    const timeout = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/products/search`, { params: { q: query, available: true, limit: 24 } });
+        setSearchResults(response.data);
+      } catch (error) {
+        toast.error('Erreur lors de la recherche');
+      }
+    }, 150);
+    return () => clearTimeout(timeout);
+  }, [query]);
+
+  const shownProducts = searchResults ?? products;
+
   const loadCart = () => {
     const savedCart = localStorage.getItem('cart');
     if (savedCart) {
@@ -147,22 +172,37 @@ const HomePage = ({ auth }) => {
 
       {/* Products Grid */}
       <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 pb-20">
+        <div className="relative max-w-xl mx-auto mb-12">
+          <Search className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-gray-400" />
+          <Input
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+            placeholder="Rechercher un produit..."
+            className="pl-10 bg-white"
+            data-testid="product-search-input"
+          />
+        </div>
+
         <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-8">
-          {products.map(product => (
+          {shownProducts.map(product => (
             <div 
               key={product.id} 
               className="product-card bg-white rounded-2xl overflow-hidden shadow-lg border border-gray-100"
               data-testid={`product-card-${product.id}`}
             >
               <Link to={`/product/${product.id}`}>
-                <div className="aspect-square overflow-hidden bg-gray-100">
+                <picture className="block aspect-square overflow-hidden bg-gray-100">
+                  {product.image_variants?.card?.webp && (
+                    <source srcSet={productImageUrl(product, 'card', 'webp')} type="image/webp" />
+                  )}
                   <img 
-                    src={`${process.env.REACT_APP_BACKEND_URL}${product.image_url}`} 
+                    src={productImageUrl(product, 'card')} 
                     alt={product.name}
+                    loading="lazy"
                     className="w-full h-full object-cover hover:scale-110 transition-transform duration-500"
                     data-testid={`product-image-${product.id}`}
                   />
-                </div>
+                </picture>
               </Link>
               
               <div className="p-6">
@@ -195,7 +235,19 @@ const HomePage = ({ auth }) => {
           ))}
         </div>
         
-        {products.length === 0 && (
+        {nextCursor && !searchResults && (
+          <div className="text-center mt-12">
+            <Button 
+              onClick={() => fetchProducts(nextCursor)} 
+              variant="outline" 
+              data-testid="load-more-products-btn"
+            >
+              Voir plus de produits
+            </Button>
+          </div>
+        )}
+        
+        {shownProducts.length === 0 && (
           <div className="text-center py-20" data-testid="no-products">
             <Package className="w-20 h-20 mx-auto text-gray-300 mb-4" />
             <p className="text-gray-500 text-lg">Aucun produit disponible pour le moment</p>
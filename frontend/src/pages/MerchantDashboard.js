@@ -9,31 +9,112 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Switch } from '@/components/ui/switch';
 import { API } from '@/App';
+import { productImageUrl } from '@/lib/utils';
 import { toast } from 'sonner';
 
 const MerchantDashboard = ({ auth }) => {
   const navigate = useNavigate();
   const [orders, setOrders] = useState([]);
+  const [ordersCursor, setOrdersCursor] = useState(null);
+  const [statusFilter, setStatusFilter] = useState('');
   const [products, setProducts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [stats, setStats] = useState(null);
 
   useEffect(() => {
-    fetchOrders();
     fetchProducts();
+    fetchStats();
   }, []);
 
-  const fetchOrders = async () => {
+  useEffect(() => {
+    fetchOrders();
+  }, [statusFilter]);
+
+  // Live order feed: new orders and status changes arrive as small deltas.
+  // EventSource can't send headers, so each connection uses a short-lived
+  // stream token instead of putting the session token in the URL
+  useEffect(() => {
+    let source = null;
+    let closed = false;
+    let retryTimer = null;
+    let lastEventId = null;
+
+    const track = (handler) => (e) => {
+      lastEventId = e.lastEventId || lastEventId;
+      handler(e);
+    };
+
+    const connect = async () => {
+      try {
+        const response = await axios.post(`${API}/orders/events/token`);
+        if (closed) return;
+        const params = new URLSearchParams({ stream_token: response.data.token });
+        if (lastEventId) params.set('last_event_id', lastEventId);
+        source = new EventSource(`${API}/orders/events?${params}`);
+      } catch (error) {
+        if (!closed) retryTimer = setTimeout(connect, 5000);
+        return;
+      }
+      source.addEventListener('order_created', track((e) => {
+        const order = JSON.parse(e.data);
+        if (!statusFilter || order.status === statusFilter) {
+          setOrders(prev => prev.some(o => o.id === order.id) ? prev : [order, ...prev]);
+        }
+        toast.info(`Nouvelle commande de ${order.customer.name}`);
+        fetchStats();
+      }));
+      source.addEventListener('order_status', track((e) => {
+        const { id, status } = JSON.parse(e.data);
+        setOrders(prev => prev
+          .map(o => o.id === id ? { ...o, status } : o)
+          .filter(o => !statusFilter || o.status === statusFilter));
+        fetchStats();
+      }));
+      source.addEventListener('resync', track(() => fetchOrders()));
+      // The stream token may have expired by the time the browser would
+      // reconnect on its own, so reconnect with a fresh one
+      source.onerror = () => {
+        source.close();
+        if (!closed) retryTimer = setTimeout(connect, 2000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [auth.token, statusFilter]);
+
+  const fetchOrders = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/orders`);
-      setOrders(response.data);
+      const response = await axios.get(`${API}/orders`, {
+        params: { cursor, status: statusFilter || undefined }
+      });
+      const { items, next_cursor } = response.data;
+      setOrders(prev => cursor ? [...prev, ...items] : items);
+      setOrdersCursor(next_cursor);
     } catch (error) {
       toast.error('Erreur lors du chargement des commandes');
     }
   };
 
-  const fetchProducts = async () => {
+  const fetchStats = async () => {
     try {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      const response = await axios.get(`${API}/stats`, { params: { granularity: 'day', buckets: 7 } });
+      setStats(response.data);
+    } catch (error) {
+      toast.error('Erreur lors du chargement des statistiques');
+    }
+  };
+
+  const fetchProducts = async (cursor = null) => {
+    try {
+      const response = await axios.get(`${API}/products`, { params: { cursor } });
+      const { items, next_cursor } = response.data;
+      setProducts(prev => cursor ? [...prev, ...items] : items);
+      setNextCursor(next_cursor);
     } catch (error) {
       toast.error('Erreur lors du chargement des produits');
     }
@@ -43,7 +124,9 @@ const MerchantDashboard = ({ auth }) => {
     try {
       await axios.patch(`${API}/orders/${orderId}/status`, { status });
       toast.success('Statut de commande mis à jour');
-      fetchOrders();
+      setOrders(prev => prev
+        .map(o => o.id === orderId ? { ...o, status } : o)
+        .filter(o => !statusFilter || o.status === statusFilter));
     } catch (error) {
       toast.error('Erreur lors de la mise à jour');
     }
@@ -51,9 +134,9 @@ const MerchantDashboard = ({ auth }) => {
 
   const updateProduct = async (productId, updates) => {
     try {
-      await axios.patch(`${API}/products/${productId}`, updates);
+      const response = await axios.patch(`${API}/products/${productId}`, updates);
       toast.success('Produit mis à jour');
-      fetchProducts();
+      setProducts(prev => prev.map(p => p.id === productId ? response.data : p));
     } catch (error) {
       toast.error('Erreur lors de la mise à jour');
     }
@@ -90,6 +173,30 @@ const MerchantDashboard = ({ auth }) => {
       </nav>
 
       <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-8">
+        {stats && (
+          <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-8" data-testid="merchant-stats">
+            <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100">
+              <p className="text-gray-600 mb-2">Commandes en attente</p>
+              <p className="text-3xl font-bold text-yellow-600">{stats.orders_by_status.pending}</p>
+            </div>
+            <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100">
+              <p className="text-gray-600 mb-2">Revenu (7 jours)</p>
+              <p className="text-3xl font-bold text-purple-600">
+                {stats.series.buckets.reduce((sum, bucket) => sum + bucket.revenue, 0).toFixed(2)}€
+              </p>
+            </div>
+            <div className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100">
+              <p className="text-gray-600 mb-2">Stock faible</p>
+              <p className="text-3xl font-bold text-red-600">{stats.low_stock.length}</p>
+              {stats.low_stock.length > 0 && (
+                <p className="text-sm text-gray-500 mt-2">
+                  {stats.low_stock.slice(0, 3).map(product => product.name).join(', ')}
+                </p>
+              )}
+            </div>
+          </div>
+        )}
+
         <Tabs defaultValue="orders" className="w-full">
           <TabsList className="mb-8">
             <TabsTrigger value="orders" className="gap-2" data-testid="orders-tab">
@@ -103,6 +210,25 @@ const MerchantDashboard = ({ auth }) => {
           </TabsList>
 
           <TabsContent value="orders">
+            <div className="flex flex-wrap gap-2 mb-6" data-testid="order-status-filter">
+              {[
+                ['', 'Toutes'],
+                ['pending', 'En attente'],
+                ['accepted', 'Acceptées'],
+                ['refused', 'Refusées'],
+                ['completed', 'Complétées']
+              ].map(([value, label]) => (
+                <Button
+                  key={value || 'all'}
+                  onClick={() => setStatusFilter(value)}
+                  variant={statusFilter === value ? 'default' : 'outline'}
+                  size="sm"
+                  data-testid={`order-filter-${value || 'all'}`}
+                >
+                  {label}
+                </Button>
+              ))}
+            </div>
             <div className="space-y-4">
               {orders.map(order => (
                 <div key={order.id} className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100" data-testid={`order-card-${order.id}`}>
@@ -167,6 +293,13 @@ const MerchantDashboard = ({ auth }) => {
                   </div>
                 </div>
               ))}
+              {ordersCursor && (
+                <div className="text-center">
+                  <Button onClick={() => fetchOrders(ordersCursor)} variant="outline" data-testid="merchant-load-more-orders-btn">
+                    Voir plus de commandes
+                  </Button>
+                </div>
+              )}
               {orders.length === 0 && (
                 <div className="text-center py-20" data-testid="no-orders">
                   <ShoppingBag className="w-20 h-20 mx-auto text-gray-300 mb-4" />
@@ -182,7 +315,7 @@ const MerchantDashboard = ({ auth }) => {
                 <div key={product.id} className="bg-white rounded-2xl p-6 shadow-lg border border-gray-100" data-testid={`product-card-${product.id}`}>
                   <div className="flex gap-6">
                     <img 
-                      src={`${process.env.REACT_APP_BACKEND_URL}${product.image_url}`}
+                      src={productImageUrl(product, 'thumb')}
                       alt={product.name}
                       className="w-32 h-32 rounded-xl object-cover"
                       data-testid={`product-mgmt-image-${product.id}`}
@@ -222,6 +355,13 @@ const MerchantDashboard = ({ auth }) => {
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <div className="text-center">
+                  <Button onClick={() => fetchProducts(nextCursor)} variant="outline" data-testid="merchant-load-more-products-btn">
+                    Voir plus de produits
+                  </Button>
+                </div>
+              )}
               {products.length === 0 && (
                 <div className="text-center py-20" data-testid="no-products-merchant">
                   <Package className="w-20 h-20 mx-auto text-gray-300 mb-4" />
@@ -4,6 +4,7 @@ import { useParams, useNavigate } from 'react-router-dom';
 import { ArrowLeft, ShoppingCart, Plus, Minus } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { API } from '@/App';
+import { productImageUrl } from '@/lib/utils';
 import { toast } from 'sonner';
 
 const ProductDetail = ({ auth }) => {
@@ -72,14 +73,17 @@ const ProductDetail = ({ auth }) => {
         </Button>
 
         <div className="grid md:grid-cols-2 gap-12">
-          <div className="aspect-square rounded-3xl overflow-hidden shadow-2xl bg-white">
+          <picture className="block aspect-square rounded-3xl overflow-hidden shadow-2xl bg-white">
+            {product.image_variants?.detail?.webp && (
+              <source srcSet={productImageUrl(product, 'detail', 'webp')} type="image/webp" />
+            )}
             <img 
-              src={`${process.env.REACT_APP_BACKEND_URL}${product.image_url}`}
+              src={productImageUrl(product, 'detail')}
               alt={product.name}
               className="w-full h-full object-cover"
               data-testid="product-detail-image"
             />
-          </div>
+          </picture>
 
           <div className="flex flex-col justify-center">
             <h1 className="text-4xl sm:text-5xl font-bold mb-6 text-gray-900" data-testid="product-detail-name">
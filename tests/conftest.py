@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# server.py connects lazily; every test swaps in an in-memory database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import server  # noqa: E402
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient(tz_aware=True)["test_database"]
+    monkeypatch.setattr(server, "db", database)
+    # Fresh in-memory limiters so buckets don't carry over between tests
+    monkeypatch.setattr(server, "rate_limiters", {
+        (route, scope): server.TokenBuckets(f"{route}:{scope}", spec)
+        for (route, scope), spec in server.RATE_LIMITS.items()
+    })
+    monkeypatch.setattr(server, "route_limiters", {
+        route: server.ConcurrencyLimiter(route, limit, max_queue)
+        for route, (limit, max_queue) in server.ROUTE_CONCURRENCY.items()
+    })
+    return database
+
+@pytest.fixture
+def add_product(db):
+    async def add(product_id, stock, price=10.0, available=True, name=None):
+        await db.products.insert_one({
+            "id": product_id,
+            "name": name or f"Produit {product_id}",
+            "description": "",
+            "price": price,
+            "image_url": f"/uploads/{product_id}.jpg",
+            "stock": stock,
+            "available": available,
+            "created_at": datetime.now(timezone.utc),
+        })
+    return add
+
+@pytest.fixture
+def product(db):
+    async def get(product_id):
+        return await db.products.find_one({"id": product_id}, {"_id": 0})
+    return get
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def lines(**quantities):
+    return [server.CartLine(product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items()]
+
+async def test_hold_reserves_and_release_gives_back(db, add_product, product):
+    await add_product("a", stock=5)
+
+    hold = await server.create_hold(lines(a=2), "10.0.0.1")
+    assert (await product("a"))["stock"] == 3
+
+    await server.release_cart_hold(hold["id"])
+    assert (await product("a"))["stock"] == 5
+    with pytest.raises(HTTPException) as error:
+        await server.release_cart_hold(hold["id"])
+    assert error.value.status_code == 404
+
+async def test_expired_hold_is_swept(db, add_product, product):
+    await add_product("a", stock=5)
+    hold = await server.create_hold(lines(a=2), "10.0.0.1")
+    await db.cart_holds.update_one(
+        {"id": hold["id"]}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+
+    assert await server.release_expired_holds() == 1
+
+    swept = await db.cart_holds.find_one({"id": hold["id"]})
+    assert swept["status"] == "expired"
+    assert "release_pending" not in swept
+    assert (await product("a"))["stock"] == 5
+    assert await server.release_expired_holds() == 0
+
+async def test_sweeper_finishes_a_release_interrupted_after_closing(db, add_product, product):
+    await add_product("a", stock=5)
+    hold = await server.create_hold(lines(a=2), "10.0.0.1")
+    # Closed, then the worker died before giving the stock back
+    await server.close_hold(hold["id"], "released")
+
+    assert await server.release_expired_holds() == 1
+    assert (await product("a"))["stock"] == 5
+
+async def test_unexpired_hold_is_converted_by_a_matching_order(db, add_product, product):
+    await add_product("a", stock=5)
+    hold = await server.create_hold(lines(a=2), "10.0.0.1")
+
+    assert await server.take_over_hold(hold["id"], {"a": 2}) == server.hold_tag(hold["id"])
+    assert (await db.cart_holds.find_one({"id": hold["id"]}))["status"] == "converted"
+    assert await server.release_expired_holds() == 0
+    assert (await product("a"))["stock"] == 3
+
+async def test_hold_not_matching_the_order_is_released(db, add_product, product):
+    await add_product("a", stock=5)
+    hold = await server.create_hold(lines(a=2), "10.0.0.1")
+
+    assert await server.take_over_hold(hold["id"], {"a": 3}) is None
+    assert (await product("a"))["stock"] == 5
+
+async def test_rejected_hold_leaves_nothing_behind(db, add_product, product):
+    await add_product("a", stock=1)
+
+    with pytest.raises(HTTPException) as error:
+        await server.create_hold(lines(a=2), "10.0.0.1")
+
+    assert error.value.status_code == 400
+    assert await db.cart_holds.count_documents({}) == 0
+    assert (await product("a"))["stock"] == 1
+
+async def test_active_holds_are_capped_per_client(db, add_product, monkeypatch):
+    monkeypatch.setattr(server, "CART_HOLD_MAX_ACTIVE_PER_IP", 2)
+    await add_product("a", stock=10)
+    for _ in range(2):
+        await server.create_hold(lines(a=1), "10.0.0.1")
+
+    with pytest.raises(HTTPException) as error:
+        await server.create_hold(lines(a=1), "10.0.0.1")
+    assert error.value.status_code == 429
+
+    # Other clients are unaffected
+    await server.create_hold(lines(a=1), "10.0.0.2")
+
+async def test_held_quantity_is_capped(db, add_product, monkeypatch):
+    monkeypatch.setattr(server, "CART_HOLD_MAX_QUANTITY", 3)
+    await add_product("a", stock=10)
+
+    with pytest.raises(HTTPException) as error:
+        await server.create_hold(lines(a=4), "10.0.0.1")
+
+    assert error.value.status_code == 422
+    assert await db.cart_holds.count_documents({}) == 0
+
+async def test_concurrent_holds_from_one_client_stay_under_the_cap(db, add_product, monkeypatch):
+    monkeypatch.setattr(server, "CART_HOLD_MAX_ACTIVE_PER_IP", 2)
+    await add_product("a", stock=10)
+
+    results = await asyncio.gather(
+        *(server.create_hold(lines(a=1), "10.0.0.1") for _ in range(5)), return_exceptions=True
+    )
+
+    assert sum(isinstance(result, dict) for result in results) <= 2
+    assert all(isinstance(result, dict) or result.status_code == 429 for result in results)
+    assert await db.cart_holds.count_documents({"client_ip": "10.0.0.1"}) <= 2
@@ -0,0 +1,89 @@
+import mongomock
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def product_queries(monkeypatch):
+    # Counts find() calls on the products collection
+    calls = []
+    find = mongomock.collection.Collection.find
+
+    def counting_find(self, *args, **kwargs):
+        if self.name == "products":
+            calls.append(args)
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", counting_find)
+    return calls
+
+def test_check_cart_reports_each_line():
+    products_by_id = {
+        "a": {"id": "a", "name": "Lampe", "price": 12.5, "stock": 5, "available": True},
+        "b": {"id": "b", "name": "Sac", "price": 40.0, "stock": 1, "available": True},
+        "c": {"id": "c", "name": "Robe", "price": 30.0, "stock": 3, "available": False},
+    }
+
+    result = server.check_cart({"a": 2, "b": 3, "c": 1, "gone": 1}, products_by_id)
+    lines = {line["product_id"]: line for line in result["items"]}
+
+    assert lines["a"]["line_total"] == 25.0 and lines["a"]["shortfall"] == 0
+    assert lines["b"]["shortfall"] == 2
+    assert lines["c"]["available"] is False and lines["c"]["line_total"] == 0.0
+    assert lines["gone"]["found"] is False
+    assert result["total"] == 145.0
+    assert result["valid"] is False
+
+async def test_validate_cart_looks_products_up_in_one_query(db, add_product, product_queries):
+    for product_id in ("a", "b", "c"):
+        await add_product(product_id, stock=5, price=10.0)
+    cart = server.Cart(items=[
+        server.CartLine(product_id="a", quantity=1),
+        server.CartLine(product_id="b", quantity=2),
+        server.CartLine(product_id="c", quantity=6),
+        server.CartLine(product_id="a", quantity=1),
+    ])
+
+    result = await server.validate_cart(cart)
+
+    assert len(product_queries) == 1
+    lines = {line["product_id"]: line for line in result["items"]}
+    assert lines["a"]["quantity"] == 2
+    assert lines["c"]["shortfall"] == 1
+    assert result["valid"] is False
+
+async def test_order_is_priced_from_the_catalog_with_one_lookup(db, add_product, product, product_queries):
+    await add_product("a", stock=5, price=12.5, name="Lampe")
+    await add_product("b", stock=5, price=40.0, name="Sac")
+    order = server.OrderCreate(
+        customer={"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"},
+        items=[
+            {"product_id": "a", "product_name": "Lampe bradée", "price": 0.01, "quantity": 2},
+            {"product_id": "b", "product_name": "Sac", "price": 1.0, "quantity": 1},
+        ],
+        total=1.02,
+    )
+
+    placed = await server.place_order(order)
+
+    assert len(product_queries) == 1
+    assert placed["total"] == 65.0
+    assert [(item["product_name"], item["price"]) for item in placed["items"]] == [("Lampe", 12.5), ("Sac", 40.0)]
+    assert (await product("a"))["stock"] == 3
+
+async def test_order_for_an_unknown_product_is_rejected(db, add_product):
+    await add_product("a", stock=5)
+    order = server.OrderCreate(
+        customer={"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"},
+        items=[{"product_id": "gone", "product_name": "Ancien", "price": 5.0, "quantity": 1}],
+        total=5.0,
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await server.place_order(order)
+
+    assert error.value.status_code == 404
+    assert await db.orders.count_documents({}) == 0
@@ -0,0 +1,82 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def counting_execute(body):
+    calls = []
+
+    async def execute(key):
+        calls.append(key)
+        await server.complete_idempotency_key(key, body)
+        return body
+
+    return execute, calls
+
+async def test_retry_replays_the_first_response(db):
+    execute, calls = counting_execute({"id": "order-1"})
+
+    first = await server.run_idempotent("orders:k1", {"total": 10}, execute)
+    second = await server.run_idempotent("orders:k1", {"total": 10}, execute)
+
+    assert calls == ["orders:k1"]
+    assert first.headers["Idempotent-Replayed"] == "false"
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert orjson.loads(second.body) == {"id": "order-1"}
+
+async def test_concurrent_duplicates_share_one_execution(db):
+    calls = []
+
+    async def execute(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        await server.complete_idempotency_key(key, {"id": "order-1"})
+        return {"id": "order-1"}
+
+    responses = await asyncio.gather(*(server.run_idempotent("orders:k1", {"total": 10}, execute) for _ in range(3)))
+
+    assert len(calls) == 1
+    assert sorted(response.headers["Idempotent-Replayed"] for response in responses) == ["false", "true", "true"]
+
+async def test_key_reused_for_another_request_is_rejected(db):
+    execute, _ = counting_execute({"id": "order-1"})
+    await server.run_idempotent("orders:k1", {"total": 10}, execute)
+
+    with pytest.raises(HTTPException) as error:
+        await server.run_idempotent("orders:k1", {"total": 99}, execute)
+
+    assert error.value.status_code == 422
+
+async def test_failed_attempt_gives_the_key_back(db):
+    async def fail(key):
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    with pytest.raises(HTTPException):
+        await server.run_idempotent("orders:k1", {"total": 10}, fail)
+
+    execute, calls = counting_execute({"id": "order-1"})
+    response = await server.run_idempotent("orders:k1", {"total": 10}, execute)
+
+    assert calls == ["orders:k1"]
+    assert response.headers["Idempotent-Replayed"] == "false"
+
+async def test_order_retry_places_one_order(db, add_product, product):
+    await add_product("a", stock=5)
+    order = server.OrderCreate(
+        customer={"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"},
+        items=[{"product_id": "a", "product_name": "Produit a", "price": 10.0, "quantity": 2}],
+        total=20.0,
+    )
+
+    for _ in range(2):
+        await server.run_idempotent(
+            "orders:k1", order.model_dump(mode="json"), lambda key: server.place_order(order, key)
+        )
+
+    assert await db.orders.count_documents({}) == 1
+    assert (await product("a"))["stock"] == 3
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+CUSTOMER = {"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"}
+
+async def place_order(add_product):
+    await add_product("a", stock=5, price=12.5, name="Lampe")
+    return await server.place_order(server.OrderCreate(
+        customer=CUSTOMER,
+        items=[{"product_id": "a", "product_name": "Lampe", "price": 12.5, "quantity": 2}],
+        total=25.0,
+    ))
+
+def stored_order(entries):
+    return {
+        "id": "o1", "customer": CUSTOMER, "total": 25.0, "status": "pending",
+        "items": [{"product_id": "a", "product_name": "Lampe", "price": 12.5, "quantity": 2}],
+        "outbox": entries,
+    }
+
+async def test_order_is_written_with_its_confirmation_email(db, add_product):
+    placed = await place_order(add_product)
+
+    order = await db.orders.find_one({"id": placed["id"]})
+    [entry] = order["outbox"]
+    assert entry["subject"] == "Confirmation de votre commande"
+    # Nothing is queued outside the order document itself
+    assert await db.notifications.count_documents({}) == 0
+    assert "outbox" not in placed
+
+async def test_status_change_adds_one_email_to_the_order(db, add_product):
+    placed = await place_order(add_product)
+    await db.orders.update_one({"id": placed["id"]}, {"$set": {"outbox": []}})
+    update = server.OrderUpdateStatus(status=server.OrderStatus.ACCEPTED)
+
+    await server.update_order_status(placed["id"], update, current_user=None)
+    # Setting the same status again doesn't email the customer twice
+    await server.update_order_status(placed["id"], update, current_user=None)
+
+    order = await db.orders.find_one({"id": placed["id"]})
+    assert order["status"] == "accepted"
+    assert len(order["outbox"]) == 1
+
+async def test_relay_queues_the_emails_and_empties_the_outbox(db, add_product):
+    placed = await place_order(add_product)
+    entry_id = (await db.orders.find_one({"id": placed["id"]}))["outbox"][0]["id"]
+
+    assert await server.relay_order_notifications() == 1
+
+    message = await db.notifications.find_one({"id": entry_id})
+    assert message["order_id"] == placed["id"]
+    assert message["to"] == "client@test.com"
+    assert message["status"] == "pending"
+    assert "Lampe x2 : 25.00€" in message["body"]
+    assert (await db.orders.find_one({"id": placed["id"]}))["outbox"] == []
+    assert await server.relay_order_notifications() == 0
+
+async def test_relay_only_pulls_the_entries_it_copied(db, monkeypatch):
+    now = datetime.now(timezone.utc)
+    await db.orders.insert_one(stored_order([{"id": "e1", "subject": "Confirmation", "intro": "", "created_at": now}]))
+    bulk_write = mongomock.collection.Collection.bulk_write
+
+    raced = []
+
+    # A status change lands between the read and the pull, the first time
+    def racing_bulk_write(self, requests, *args, **kwargs):
+        result = bulk_write(self, requests, *args, **kwargs)
+        if self.name == "notifications" and not raced:
+            raced.append(True)
+            self.database.orders.update_one(
+                {"id": "o1"}, {"$push": {"outbox": {"id": "e2", "subject": "Acceptée", "intro": "", "created_at": now}}}
+            )
+        return result
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", racing_bulk_write)
+    await server.relay_order_outbox(db.orders)
+
+    outbox = (await db.orders.find_one({"id": "o1"}))["outbox"]
+    assert [entry["id"] for entry in outbox] == ["e2"]
+    await server.relay_order_outbox(db.orders)
+    assert sorted(await db.notifications.distinct("id")) == ["e1", "e2"]
+
+async def test_relaying_twice_queues_one_message(db):
+    now = datetime.now(timezone.utc)
+    entry = {"id": "e1", "subject": "Confirmation", "intro": "", "created_at": now}
+    await db.orders.insert_one(stored_order([entry]))
+    await server.relay_order_outbox(db.orders)
+    await db.notifications.update_one({"id": "e1"}, {"$set": {"status": "sent"}})
+
+    # As if the worker died before pulling the entry off the order
+    await db.orders.update_one({"id": "o1"}, {"$push": {"outbox": entry}})
+    await server.relay_order_outbox(db.orders)
+
+    assert await db.notifications.count_documents({}) == 1
+    assert (await db.notifications.find_one({"id": "e1"}))["status"] == "sent"
+
+async def test_archived_orders_are_relayed_too(db):
+    now = datetime.now(timezone.utc)
+    await db.orders_archive.insert_one(stored_order([{"id": "e1", "subject": "Livrée", "intro": "", "created_at": now}]))
+
+    assert await server.relay_order_notifications() == 1
+    assert await db.notifications.count_documents({"id": "e1"}) == 1
+
+async def queue_message(db, attempts=0):
+    await db.notifications.insert_one({
+        "id": "n1", "to": "client@test.com", "subject": "Confirmation", "body": "Bonjour",
+        "status": "pending", "attempts": attempts, "next_attempt_at": datetime.now(timezone.utc),
+    })
+
+async def test_sent_message_is_marked_sent(db, monkeypatch):
+    monkeypatch.setattr(server, "send_emails", lambda messages: [None] * len(messages))
+    await queue_message(db)
+
+    assert await server.process_notifications() == 1
+    assert (await db.notifications.find_one({"id": "n1"}))["status"] == "sent"
+    assert await server.process_notifications() == 0
+
+async def test_failed_message_is_retried_with_backoff(db, monkeypatch):
+    monkeypatch.setattr(server, "send_emails", lambda messages: ["550 mailbox busy"] * len(messages))
+    await queue_message(db)
+
+    delays = []
+    for _ in range(3):
+        started = datetime.now(timezone.utc)
+        assert await server.process_notifications() == 1
+        message = await db.notifications.find_one({"id": "n1"})
+        delays.append(round((message["next_attempt_at"] - started).total_seconds()))
+        # Not claimed again before its next attempt
+        assert await server.process_notifications() == 0
+        await db.notifications.update_one({"id": "n1"}, {"$set": {"next_attempt_at": started}})
+
+    assert message["status"] == "pending"
+    assert message["attempts"] == 3
+    assert message["last_error"] == "550 mailbox busy"
+    base = server.NOTIFICATION_RETRY_BASE_SECONDS
+    assert delays == [base, base * 2, base * 4]
+
+async def test_message_gives_up_after_the_last_attempt(db, monkeypatch):
+    def connection_refused(messages):
+        raise ConnectionRefusedError("Connection refused")
+
+    monkeypatch.setattr(server, "send_emails", connection_refused)
+    await queue_message(db, attempts=server.NOTIFICATION_MAX_ATTEMPTS - 1)
+
+    await server.process_notifications()
+
+    message = await db.notifications.find_one({"id": "n1"})
+    assert message["status"] == "failed"
+    assert message["attempts"] == server.NOTIFICATION_MAX_ATTEMPTS
+    assert message["last_error"] == "Connection refused"
+
+async def test_claim_taken_over_after_a_stalled_worker(db, monkeypatch):
+    monkeypatch.setattr(server, "send_emails", lambda messages: [None] * len(messages))
+    await queue_message(db)
+    stalled = datetime.now(timezone.utc) - timedelta(seconds=server.NOTIFICATION_CLAIM_TIMEOUT_SECONDS + 1)
+    await db.notifications.update_one({"id": "n1"}, {"$set": {"status": "sending", "claimed_at": stalled}})
+
+    assert await server.process_notifications() == 1
+    assert (await db.notifications.find_one({"id": "n1"}))["status"] == "sent"
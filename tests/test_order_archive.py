@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+from fastapi import Request
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+def stored_order(order_id, status="completed", days_ago=0):
+    return {
+        "id": order_id,
+        "customer": {"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"},
+        "items": [{"product_id": "a", "product_name": "Lampe", "price": 12.5, "quantity": 1}],
+        "total": 12.5,
+        "status": status,
+        "created_at": NOW - timedelta(days=days_ago),
+    }
+
+async def list_orders(**filters):
+    request = Request({"type": "http", "method": "GET", "path": "/api/orders", "headers": []})
+    arguments = {"limit": 50, "cursor": None, "status": None, "email": None, "created_from": None,
+                 "created_to": None, "view": server.OrderView.FULL, **filters}
+    response = await server.get_orders(request, current_user=None, **arguments)
+    return orjson.loads(response.body)
+
+async def test_pages_span_live_and_archived_orders(db):
+    # Newest first: o5 live, o4 archived, o3 live, o2 and o1 archived
+    await db.orders.insert_many([stored_order("o5", "pending", 1), stored_order("o3", "accepted", 3)])
+    await db.orders_archive.insert_many(
+        [stored_order("o4", days_ago=2), stored_order("o2", days_ago=4), stored_order("o1", "refused", 5)]
+    )
+
+    seen = []
+    cursor = None
+    while True:
+        page = await list_orders(limit=2, cursor=cursor)
+        seen.append([order["id"] for order in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [["o5", "o4"], ["o3", "o2"], ["o1"]]
+
+async def test_order_caught_mid_move_is_listed_once(db):
+    await db.orders.insert_one(stored_order("o1"))
+    await db.orders_archive.insert_one({**stored_order("o1"), "total": 99.0})
+
+    page = await list_orders()
+
+    assert [(order["id"], order["total"]) for order in page["items"]] == [("o1", 12.5)]
+
+async def test_live_only_filters_skip_the_archive(db):
+    await db.orders_archive.insert_one(stored_order("archived"))
+
+    assert not server.archive_may_match({"status": "pending"})
+    assert server.archive_may_match({"status": "completed"})
+    assert not server.archive_may_match({"created_at": {"$gte": NOW - timedelta(days=7)}})
+    assert server.archive_may_match({"created_at": {"$gte": NOW - timedelta(days=365)}})
+    assert (await list_orders(status=server.OrderStatus.PENDING))["items"] == []
+    assert [order["id"] for order in (await list_orders(status=server.OrderStatus.COMPLETED))["items"]] == ["archived"]
+
+async def test_export_merges_both_collections_oldest_first(db):
+    await db.orders.insert_many([stored_order("live", "pending", 1), stored_order("moving", days_ago=2)])
+    # Legacy documents still hold created_at as an ISO string
+    legacy = {**stored_order("legacy", days_ago=3), "created_at": (NOW - timedelta(days=3)).isoformat()}
+    await db.orders_archive.insert_many([stored_order("moving", days_ago=2), legacy])
+
+    body = b"".join([chunk async for chunk in server.export_orders({}, "ndjson", False)])
+
+    rows = [orjson.loads(line) for line in body.splitlines()]
+    assert [row["order_id"] for row in rows] == ["legacy", "moving", "live"]
+    assert rows[0]["created_at"] == (NOW - timedelta(days=3)).isoformat()
+
+async def test_reopened_archived_order_goes_back_live(db):
+    await db.orders_archive.insert_one({**stored_order("o1", days_ago=200), "updated_at": NOW})
+
+    await server.update_order_status(
+        "o1", server.OrderUpdateStatus(status=server.OrderStatus.ACCEPTED), current_user=None
+    )
+
+    assert await db.orders_archive.count_documents({}) == 0
+    assert (await db.orders.find_one({"id": "o1"}))["status"] == "accepted"
+    page = await list_orders(status=server.OrderStatus.ACCEPTED)
+    assert [order["id"] for order in page["items"]] == ["o1"]
+
+async def test_restoring_twice_is_harmless(db):
+    await db.orders_archive.insert_one(stored_order("o1", "accepted"))
+
+    await server.restore_archived_order("o1")
+    await server.restore_archived_order("o1")
+
+    assert await db.orders.count_documents({"id": "o1"}) == 1
+    assert await db.orders_archive.count_documents({}) == 0
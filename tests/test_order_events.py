@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import orjson
+import pytest
+from fastapi import HTTPException, Request
+from pymongo.errors import OperationFailure
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = server.OrderEventBroker(history=3, queue_size=4)
+    monkeypatch.setattr(server, "order_events", broker)
+    return broker
+
+@pytest.fixture
+def merchant(db, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(10, 60))
+    return server.User(email="merchant@shop.com", role=server.UserRole.MERCHANT)
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return [(event_id, event_type) for _, event_id, event_type, _ in events]
+
+def stream_request(token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_subscribers_get_published_events(broker):
+    queue = broker.subscribe(None)
+
+    broker.publish("order_created", {"id": "o1"})
+    broker.publish("order_status", {"id": "o1", "status": "accepted"})
+
+    assert drain(queue) == [(f"{broker.epoch}-1", "order_created"), (f"{broker.epoch}-2", "order_status")]
+
+def test_reconnecting_client_gets_what_it_missed(broker):
+    for number in range(3):
+        broker.publish("order_created", {"id": f"o{number}"})
+
+    queue = broker.subscribe(f"{broker.epoch}-1")
+
+    assert drain(queue) == [(f"{broker.epoch}-2", "order_created"), (f"{broker.epoch}-3", "order_created")]
+
+@pytest.mark.parametrize("last_event_id", ["other-2", "{epoch}-9", "{epoch}-x"])
+def test_unknown_last_event_id_gets_a_resync(broker, last_event_id):
+    broker.publish("order_created", {"id": "o1"})
+
+    queue = broker.subscribe(last_event_id.format(epoch=broker.epoch))
+
+    assert drain(queue) == [(None, "resync")]
+
+def test_events_older_than_the_history_get_a_resync(broker):
+    for number in range(5):
+        broker.publish("order_created", {"id": f"o{number}"})
+
+    # History holds events 3 to 5; event 2 is still contiguous, 1 is not
+    assert len(drain(broker.subscribe(f"{broker.epoch}-2"))) == 3
+    assert drain(broker.subscribe(f"{broker.epoch}-1")) == [(None, "resync")]
+
+def test_slow_subscriber_is_told_to_resync(broker):
+    queue = broker.subscribe(None)
+
+    for number in range(5):
+        broker.publish("order_created", {"id": f"o{number}"})
+
+    assert drain(queue) == [(None, "resync")]
+
+async def test_stream_token_opens_the_event_stream(db, merchant):
+    await db.users.insert_one(merchant.model_dump())
+
+    user = await server.get_stream_user(stream_request(), server.create_stream_token(merchant))
+
+    assert user.email == merchant.email
+
+async def test_expired_stream_token_is_rejected(db, merchant):
+    await db.users.insert_one(merchant.model_dump())
+    claims = {"sub": merchant.email, "scope": server.ORDER_EVENTS_SCOPE, "exp": datetime.now(timezone.utc) - timedelta(seconds=1)}
+    expired = jwt.encode(claims, server.SECRET_KEY, algorithm=server.ALGORITHM)
+
+    with pytest.raises(HTTPException) as error:
+        await server.get_stream_user(stream_request(), expired)
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Token expired"
+
+async def test_tokens_only_open_their_own_endpoint(db, merchant):
+    await db.users.insert_one(merchant.model_dump())
+    session_token = server.create_access_token({"sub": merchant.email})
+    stream_token = server.create_stream_token(merchant)
+
+    for request, token in [(stream_request(), session_token), (stream_request(stream_token), None)]:
+        with pytest.raises(HTTPException) as error:
+            await server.get_stream_user(request, token)
+        assert error.value.status_code == 401
+
+    with pytest.raises(HTTPException) as error:
+        await server.get_stream_user(stream_request(), "not-a-token")
+    assert error.value.status_code == 401
+
+def published(queue):
+    events = []
+    while not queue.empty():
+        _, _, event_type, data = queue.get_nowait()
+        events.append((event_type, orjson.loads(data)))
+    return events
+
+async def test_polling_publishes_new_orders_and_status_changes(db, broker, monkeypatch):
+    monkeypatch.setattr(server, "ORDER_EVENTS_POLL_INTERVAL", 0.01)
+    queue = broker.subscribe(None)
+    # BSON keeps milliseconds
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    poller = asyncio.create_task(server.poll_order_changes())
+    try:
+        await db.orders.insert_one({"id": "o1", "status": "pending", "created_at": now, "updated_at": now})
+        await asyncio.sleep(0.05)
+        # Status changes can reach archived orders too
+        await db.orders_archive.insert_one(
+            {"id": "o2", "status": "completed", "created_at": now, "updated_at": now + timedelta(seconds=1)}
+        )
+        await asyncio.sleep(0.05)
+    finally:
+        poller.cancel()
+
+    assert broker.source == "poll"
+    assert published(queue) == [
+        ("order_created", {"id": "o1", "status": "pending", "created_at": now.isoformat()}),
+        ("order_status", {"id": "o2", "status": "completed"}),
+    ]
+
+class FakeChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for change in self.changes:
+            yield change
+        raise asyncio.CancelledError
+
+async def test_change_stream_publishes_inserts_and_status_updates(db, broker, monkeypatch):
+    now = datetime.now(timezone.utc)
+    changes = [
+        {"operationType": "insert", "fullDocument": {"id": "o1", "status": "pending", "created_at": now, "outbox": []}},
+        {"operationType": "update", "updateDescription": {"updatedFields": {"outbox": []}},
+         "fullDocument": {"id": "o1", "status": "pending"}},
+        {"operationType": "update", "updateDescription": {"updatedFields": {"status": "accepted"}},
+         "fullDocument": {"id": "o1", "status": "accepted"}},
+    ]
+    monkeypatch.setattr(type(db.orders), "watch", lambda collection, *args, **kwargs: FakeChangeStream(changes), raising=False)
+    queue = broker.subscribe(None)
+
+    with pytest.raises(asyncio.CancelledError):
+        await server.watch_order_changes()
+
+    assert broker.source == "change_stream"
+    # Bookkeeping fields such as the outbox stay out of the feed
+    assert published(queue) == [
+        ("order_created", {"id": "o1", "status": "pending", "created_at": now.isoformat()}),
+        ("order_status", {"id": "o1", "status": "accepted"}),
+    ]
+
+async def test_standalone_server_falls_back_to_polling(db, broker, monkeypatch):
+    def no_change_streams(collection, *args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    polled = []
+
+    async def poll():
+        polled.append(True)
+
+    monkeypatch.setattr(type(db.orders), "watch", no_change_streams, raising=False)
+    monkeypatch.setattr(server, "poll_order_changes", poll)
+
+    await server.watch_order_changes()
+
+    assert polled == [True]
@@ -0,0 +1,70 @@
+import io
+
+import orjson
+import pytest
+from fastapi import BackgroundTasks, HTTPException, Request
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOADS_DIR", tmp_path)
+    (tmp_path / "lampe.jpg").write_bytes(b"")
+
+async def run_import(body: bytes, file_format: str = "csv") -> list:
+    stream = server.run_product_import(io.BytesIO(body), file_format, None, [])
+    return [orjson.loads(line) async for line in stream]
+
+async def test_undecodable_bytes_end_the_import_with_a_summary(db):
+    lines = await run_import(
+        b"sku,name,description,price,stock,image_url\n"
+        b"s1,Lampe,Lampe de bureau,19.9,4,/uploads/lampe.jpg\n"
+        b"s2,\xff\xfeSac,Sac,10,1,/uploads/sac.jpg\n"
+    )
+
+    fatal = [line["error"] for line in lines if "error" in line]
+    assert len(fatal) == 1 and fatal[0]["fatal"] is True
+    assert fatal[0]["errors"][0]["field"] is None
+    assert fatal[0]["errors"][0]["message"].startswith("Invalid UTF-8")
+    assert lines[-1] == {"done": {"rows": 1, "created": 1, "updated": 0, "failed": 1}, "aborted": True}
+    assert await db.products.count_documents({}) == 1
+
+async def test_complete_import_is_not_marked_aborted(db):
+    lines = await run_import(b'{"sku": "s1", "name": "Lampe", "description": "Lampe de bureau", "price": 19.9, "stock": 4, '
+                             b'"image_url": "/uploads/lampe.jpg"}\n', "ndjson")
+
+    assert lines[-1] == {"done": {"rows": 1, "created": 1, "updated": 0, "failed": 0}, "aborted": False}
+
+def upload_request(body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "query_string": b""}, receive)
+
+@pytest.fixture
+def spooled(monkeypatch):
+    handles = []
+    spool = server.spool_request_body
+
+    async def recording_spool(request):
+        handles.append(await spool(request))
+        return handles[-1]
+
+    monkeypatch.setattr(server, "spool_request_body", recording_spool)
+    return handles
+
+async def test_unread_import_response_still_closes_the_upload(db, spooled):
+    background_tasks = BackgroundTasks()
+    await server.import_products(upload_request(b"sku,name\n"), background_tasks, "csv", None, None)
+
+    # The stream is never iterated, as when the client goes away first
+    await background_tasks()
+    assert spooled[0].closed
+
+async def test_unknown_image_source_closes_the_upload(db, spooled):
+    with pytest.raises(HTTPException) as error:
+        await server.import_products(upload_request(b"sku,name\n"), BackgroundTasks(), "csv", "missing.zip", None)
+
+    assert error.value.status_code == 400
+    assert spooled[0].closed
@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_legacy_product_gets_the_model_defaults(db):
+    # Written before image variants and availability existed
+    await db.products.insert_one({
+        "id": "old", "name": "Lampe", "description": "Lampe de bureau", "price": 19.9,
+        "image_url": "/uploads/old.jpg", "stock": 4, "created_at": datetime.now(timezone.utc),
+    })
+
+    page = await server.find_products(10, None, None, None, None, server.ProductSort.NEWEST)
+
+    [product] = page["items"]
+    assert product["image_variants"] == {}
+    assert product["available"] is True
+    assert server.Product(**product).model_dump() == product
+
+async def test_stored_fields_are_kept(db, add_product):
+    await add_product("a", stock=2, available=False)
+    await db.products.update_one({"id": "a"}, {"$set": {"image_variants": {"thumb": {"webp": "/uploads/a.webp"}}}})
+
+    page = await server.find_products(10, None, None, None, None, server.ProductSort.NEWEST)
+
+    assert page["items"][0]["available"] is False
+    assert page["items"][0]["image_variants"] == {"thumb": {"webp": "/uploads/a.webp"}}
@@ -0,0 +1,87 @@
+import asyncio
+import ipaddress
+
+import httpx
+import pytest
+from fastapi import HTTPException, Request
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def test_bucket_allows_the_burst_then_asks_to_wait():
+    buckets = server.TokenBuckets("login:ip", "3/60")
+
+    assert [buckets.take_local("10.0.0.1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = buckets.take_local("10.0.0.1")
+
+    assert 0 < wait <= 20
+    assert buckets.take_local("10.0.0.2") == 0.0
+
+async def test_login_is_rate_limited_per_account(db, monkeypatch):
+    monkeypatch.setitem(server.rate_limiters, ("login", "account"), server.TokenBuckets("login:account", "2/60"))
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        credentials = {"email": "admin@shop.com", "password": "wrong"}
+        statuses = [(await client.post("/api/auth/login", json=credentials)).status_code for _ in range(2)]
+        limited = await client.post("/api/auth/login", json=credentials)
+        other_account = await client.post("/api/auth/login", json={**credentials, "email": "other@shop.com"})
+
+    assert statuses == [401, 401]
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert other_account.status_code == 401
+
+async def test_checkout_is_rate_limited_per_ip(db, add_product, monkeypatch):
+    monkeypatch.setitem(server.rate_limiters, ("checkout", "ip"), server.TokenBuckets("checkout:ip", "1/60"))
+    await add_product("a", stock=5)
+    order = {
+        "customer": {"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"},
+        "items": [{"product_id": "a", "product_name": "Produit a", "price": 10.0, "quantity": 1}],
+        "total": 10.0,
+    }
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.post("/api/orders", json=order)
+        second = await client.post("/api/orders", json={**order, "customer": {**order["customer"], "email": "x@test.com"}})
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert await db.orders.count_documents({}) == 1
+
+async def test_concurrency_limiter_sheds_when_the_queue_is_full():
+    limiter = server.ConcurrencyLimiter("checkout", limit=1, max_queue=0)
+    async with limiter:
+        with pytest.raises(HTTPException) as error:
+            async with limiter:
+                pass
+    assert error.value.status_code == 503
+    assert limiter.stats()["active"] == 0
+
+async def test_concurrency_limiter_sheds_after_the_queue_timeout(monkeypatch):
+    monkeypatch.setattr(server, "ROUTE_QUEUE_TIMEOUT", 0.01)
+    limiter = server.ConcurrencyLimiter("checkout", limit=1, max_queue=1)
+    async with limiter:
+        with pytest.raises(HTTPException) as error:
+            async with limiter:
+                pass
+        await asyncio.sleep(0)
+    assert error.value.status_code == 503
+    assert limiter.stats()["queued"] == 0
+
+def forwarded_request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (peer, 1234)})
+
+def test_forwarded_address_is_only_trusted_from_a_proxy(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+    assert server.client_address(forwarded_request("10.0.0.5", "203.0.113.7")) == "203.0.113.7"
+    # A client can't pick its own bucket by sending the header itself
+    assert server.client_address(forwarded_request("198.51.100.2", "203.0.113.7")) == "198.51.100.2"
+    # Entries left of the first untrusted hop may be forged
+    assert server.client_address(forwarded_request("10.0.0.5", "1.2.3.4, 203.0.113.7, 10.0.0.9")) == "203.0.113.7"
+    assert server.client_address(forwarded_request("10.0.0.5")) == "10.0.0.5"
+
+def test_forwarded_address_is_ignored_without_trusted_proxies():
+    assert server.client_address(forwarded_request("10.0.0.5", "203.0.113.7")) == "10.0.0.5"
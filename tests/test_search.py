@@ -0,0 +1,107 @@
+import mongomock
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def index(monkeypatch):
+    index = server.SearchIndex()
+    index.ready = True
+    monkeypatch.setattr(server, "search_index", index)
+    return index
+
+def catalog(index, *products):
+    for product_id, name, description in products:
+        index.add({"id": product_id, "name": name, "description": description})
+
+def test_name_matches_rank_above_description_matches(index):
+    catalog(
+        index,
+        ("desc", "Abat-jour", "Pour votre lampe de chevet"),
+        ("name", "Lampe de chevet", "Laiton"),
+        ("other", "Sac", "Cuir"),
+    )
+
+    assert index.search("lampe", 10) == ["name", "desc"]
+
+def test_exact_words_rank_above_prefix_matches(index):
+    catalog(index, ("prefix", "Lampes", ""), ("exact", "Lampe", ""), ("longer", "Lampadaire", ""))
+
+    assert index.search("lampe", 10) == ["exact", "prefix"]
+    assert set(index.search("lamp", 10)) == {"exact", "prefix", "longer"}
+
+def test_every_query_word_has_to_match(index):
+    catalog(index, ("a", "Robe d'été", "Lin"), ("b", "Robe de soirée", "Soie"))
+
+    # Accents are ignored and the last word is matched as a prefix
+    assert index.search("robe ete", 10) == ["a"]
+    assert index.search("robe soi", 10) == ["b"]
+    assert index.search("robe velours", 10) == []
+
+def test_removed_products_leave_the_index(index):
+    catalog(index, ("a", "Lampe", ""), ("b", "Lampion", ""))
+
+    index.remove("a")
+
+    assert index.search("lamp", 10) == ["b"]
+    assert index.search("lampe", 10) == []
+
+async def test_stopword_only_query_matches_nothing(db, index, add_product):
+    await add_product("a", stock=1, name="Le sac de la plage")
+    catalog(index, ("a", "Le sac de la plage", ""))
+
+    assert await server.search_products("de la", 10, None) == []
+
+async def test_search_returns_products_in_rank_order(db, index, add_product):
+    await add_product("a", stock=1, name="Lampadaire")
+    await add_product("b", stock=1, name="Lampe")
+    await add_product("c", stock=1, name="Lampe", available=False)
+    await server.rebuild_search_index()
+
+    products = await server.search_products("lampe", 10, True)
+
+    assert [product["id"] for product in products] == ["b"]
+
+async def test_another_workers_write_triggers_a_rebuild(db, index, add_product):
+    await add_product("a", stock=1, name="Lampe")
+    await server.rebuild_search_index()
+    # Another worker adds a product and bumps the version
+    await add_product("b", stock=1, name="Lampion")
+    await db.meta.update_one({"_id": "search_version"}, {"$inc": {"value": 1}}, upsert=True)
+
+    # A local write right after must not skip past it
+    await server.bump_search_version()
+    assert server.search_index.version == 0
+
+    await server.rebuild_search_index()
+    assert server.search_index.version == 2
+    assert set(server.search_index.search("lamp", 10)) == {"a", "b"}
+
+async def test_local_write_advances_the_version_without_a_rebuild(db, index):
+    await server.rebuild_search_index()
+    built = server.search_index
+
+    await server.bump_search_version()
+
+    assert server.search_index is built
+    assert built.version == 1
+
+async def test_text_index_answers_until_the_index_is_built(db, index, monkeypatch):
+    index.ready = False
+    queries = []
+    find = mongomock.collection.Collection.find
+
+    # mongomock has no $text; record the query instead of running it
+    def recording_find(self, *args, **kwargs):
+        if self.name == "products" and "$text" in args[0]:
+            queries.append(args[0])
+            return find(self, {"id": None})
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", recording_find)
+    monkeypatch.setattr(mongomock.collection.Cursor, "sort", lambda cursor, *args, **kwargs: cursor)
+
+    assert await server.search_products("lampe", 10, True) == []
+    assert queries == [{"available": True, "$text": {"$search": "lampe"}}]
@@ -0,0 +1,75 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+CUSTOMER = {"name": "Client", "email": "client@test.com", "phone": "0123456789", "address": "Paris"}
+COUNTERS = ("orders", "orders_by_status", "revenue_cents", "products", "products_available")
+
+@pytest.fixture(autouse=True)
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOADS_DIR", tmp_path)
+    (tmp_path / "photo.jpg").write_bytes(b"")
+
+async def import_catalog(*products):
+    body = b"".join(
+        orjson.dumps({"sku": sku, "name": name, "description": name, "price": price, "stock": stock,
+                      "image_url": "/uploads/photo.jpg"}) + b"\n"
+        for sku, name, price, stock in products
+    )
+    return [orjson.loads(line) async for line in server.run_product_import(io.BytesIO(body), "ndjson", None, [])]
+
+async def order(product_id, quantity):
+    placed = await server.place_order(server.OrderCreate(
+        customer=CUSTOMER,
+        items=[{"product_id": product_id, "product_name": "", "price": 0, "quantity": quantity}],
+        total=0,
+    ))
+    return placed["id"]
+
+async def set_status(order_id, status):
+    await server.update_order_status(order_id, server.OrderUpdateStatus(status=status), current_user=None)
+
+async def counters(db):
+    totals = await db.stats.find_one({"_id": "totals"})
+    series = await db.revenue_series.find({"orders": {"$gt": 0}}, {"_id": 1, "orders": 1, "revenue_cents": 1}) \
+        .sort("_id", 1).to_list(None)
+    return {name: totals.get(name) for name in COUNTERS}, series
+
+async def test_incremental_counters_match_the_reconciliation(db):
+    await import_catalog(("lampe", "Lampe", 19.9, 2), ("sac", "Sac", 40.0, 5), ("robe", "Robe", 30.5, 1))
+    ids = {product["name"]: product["id"] for product in await db.products.find({}, {"id": 1, "name": 1}).to_list(None)}
+
+    # Sells the lamp out
+    lamp_order = await order(ids["Lampe"], 2)
+    refused = await order(ids["Sac"], 1)
+    delivered = await order(ids["Sac"], 2)
+    await order(ids["Robe"], 1)
+    await set_status(refused, server.OrderStatus.REFUSED)
+    await set_status(delivered, server.OrderStatus.ACCEPTED)
+    await set_status(delivered, server.OrderStatus.COMPLETED)
+    await set_status(lamp_order, server.OrderStatus.ACCEPTED)
+    await server.update_product(ids["Sac"], server.ProductUpdate(available=False), current_user=None)
+    await server.delete_product(ids["Robe"], current_user=None)
+    # Archived orders still count
+    assert await server.archive_orders_batch(datetime.now(timezone.utc) + timedelta(seconds=1)) == 2
+
+    incremental = await counters(db)
+    await server.reconcile_stats()
+    reconciled = await counters(db)
+
+    assert incremental == reconciled
+    totals, series = reconciled
+    assert totals == {
+        "orders": 4,
+        "orders_by_status": {"pending": 1, "accepted": 1, "refused": 1, "completed": 1},
+        "revenue_cents": 3980 + 8000 + 3050,
+        "products": 2,
+        "products_available": 0,
+    }
+    assert [(bucket["orders"], bucket["revenue_cents"]) for bucket in series] == [(4, 15030), (4, 15030)]
@@ -0,0 +1,113 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_reserve_decrements_and_tags(db, add_product, product):
+    await add_product("a", stock=5)
+    await add_product("b", stock=3)
+
+    await server.reserve_stock("order-1", {"a": 2, "b": 3})
+
+    assert (await product("a"))["stock"] == 3
+    assert (await product("b"))["stock"] == 0
+    assert (await product("a"))["pending_orders"] == ["order-1"]
+
+async def test_settle_clears_tags_and_marks_sold_out(db, add_product, product):
+    await add_product("a", stock=2)
+    await server.reserve_stock("order-1", {"a": 2})
+
+    await server.settle_stock("order-1", ["a"])
+
+    sold_out = await product("a")
+    assert sold_out["pending_orders"] == []
+    assert sold_out["available"] is False
+
+async def test_failed_line_rolls_back_the_others(db, add_product, product):
+    await add_product("a", stock=5)
+    await add_product("b", stock=5)
+    # Read before a concurrent buyer took most of "b"
+    products_by_id = await server.resolve_cart(["a", "b"])
+    await db.products.update_one({"id": "b"}, {"$set": {"stock": 1}})
+
+    with pytest.raises(HTTPException) as error:
+        await server.reserve_stock("order-1", {"a": 2, "b": 3}, products_by_id=products_by_id)
+
+    assert error.value.status_code == 400
+    assert (await product("a"))["stock"] == 5
+    assert (await product("a"))["pending_orders"] == []
+    assert (await product("b"))["stock"] == 1
+
+async def test_insufficient_stock_is_rejected_before_writing(db, add_product, product):
+    await add_product("a", stock=1)
+
+    with pytest.raises(HTTPException) as error:
+        await server.reserve_stock("order-1", {"a": 2}, {"a": "Lampe"})
+
+    assert error.value.status_code == 400
+    assert error.value.detail == "Insufficient stock for Lampe"
+    assert (await product("a"))["stock"] == 1
+
+async def test_release_twice_gives_back_once(db, add_product, product):
+    await add_product("a", stock=5)
+    await server.reserve_stock("order-1", {"a": 2})
+
+    await server.release_stock("order-1", {"a": 2})
+    await server.release_stock("order-1", {"a": 2})
+
+    assert (await product("a"))["stock"] == 5
+
+async def shard_total(db, product_id):
+    shards = await db.stock_shards.find({"product_id": product_id}).to_list(None)
+    return sum(shard["stock"] for shard in shards)
+
+async def test_line_bigger_than_a_shard_is_split_across_shards(db, add_product):
+    await add_product("hot", stock=8)
+    await server.set_stock_shards("hot", shards=4, current_user=None)
+
+    # Each shard holds 2
+    await server.reserve_stock("order-1", {"hot": 3})
+    assert await shard_total(db, "hot") == 5
+
+    await server.release_stock("order-1", {"hot": 3})
+    await server.release_stock("order-1", {"hot": 3})
+    assert await shard_total(db, "hot") == 8
+    assert await db.stock_shards.count_documents({"pending_orders.tag": "order-1"}) == 0
+
+async def test_sharded_line_rolls_back_with_the_rest(db, add_product, product):
+    await add_product("a", stock=5)
+    await add_product("hot", stock=8)
+    await server.set_stock_shards("hot", shards=4, current_user=None)
+
+    with pytest.raises(HTTPException):
+        await server.reserve_stock("order-1", {"a": 1, "hot": 9})
+
+    assert (await product("a"))["stock"] == 5
+    assert await shard_total(db, "hot") == 8
+
+async def test_settled_split_line_leaves_no_reservation(db, add_product):
+    await add_product("hot", stock=4)
+    await server.set_stock_shards("hot", shards=2, current_user=None)
+
+    await server.reserve_stock("order-1", {"hot": 4})
+    await server.settle_stock("order-1", ["hot"])
+
+    assert await db.stock_shards.count_documents({"pending_orders.0": {"$exists": True}}) == 0
+    assert await shard_total(db, "hot") == 0
+
+async def test_stock_edit_on_sharded_product_keeps_reservations(db, add_product):
+    await add_product("hot", stock=8)
+    await server.set_stock_shards("hot", shards=4, current_user=None)
+    product = await db.products.find_one({"id": "hot"})
+    # A reservation lands between the edit's read and its write
+    await server.reserve_stock("order-1", {"hot": 3})
+
+    await server.adjust_stock_shards("hot", 10, product["stock_shards"])
+    assert await shard_total(db, "hot") == 10
+    await server.adjust_stock_shards("hot", 4, product["stock_shards"])
+    assert await shard_total(db, "hot") == 4
+
+    await server.release_stock("order-1", {"hot": 3})
+    assert await shard_total(db, "hot") == 7
@@ -0,0 +1,23 @@
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_oversized_image_upload_is_rejected_before_parsing(monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 1024)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/products", content=b"x" * (66 * 1024 + 1))
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Image too large"}
+
+async def test_other_requests_pass_through_the_upload_check(db, monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 1024)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/cart/validate", content=b"x" * (66 * 1024 + 1))
+
+    assert response.status_code == 422